@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Load-test and benchmark suite for the Yearbook API.
+
+Boots the FastAPI app in-process, seeds N colleges x M students and drives a
+weighted mix of realistic traffic (login storms, dashboard loads, admin list
+views, bulk uploads, photo uploads, testimonial writes) from concurrent async
+clients. Reports throughput and p50/p99 latency per route, and writes the
+results as JSON so runs can be compared before and after a change.
+
+Runs against an in-memory Motor stand-in by default, or a local mongod with
+--mongo-url (the benchmark database is dropped first). Needs the optional
+packages httpx and, for the in-memory mode, mongomock-motor:
+
+    pip install httpx mongomock-motor
+    python benchmark.py --colleges 2 --students 200 --concurrency 20 --duration 30 --output before.json
+    python benchmark.py ... --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+BENCH_PASSWORD = "bench-password"
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"  # uploads are sniffed for an image signature
+
+# Weighted traffic mix; weights are relative
+SCENARIOS = {
+    "login": 5,
+    "dashboard": 40,
+    "admin_students": 5,
+    "bulk_upload": 1,
+    "photo_upload": 10,
+    "testimonial_write": 20,
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+def gridfs_support(args):
+    """Context in which photo uploads can reach GridFS; in-memory mode needs mongomock-motor's patch"""
+    if args.mongo_url:
+        return contextlib.nullcontext()
+    try:
+        from mongomock_motor import enabled_gridfs_integration
+    except ImportError:
+        if "photo_upload" not in args.skip:
+            print("⚠️  This mongomock-motor has no GridFS support; skipping photo_upload (upgrade it or pass --mongo-url)")
+            args.skip.append("photo_upload")
+        return contextlib.nullcontext()
+    return enabled_gridfs_integration()
+
+
+def load_app(args):
+    """Import server.py against the requested database and return the module."""
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://localhost:27017"
+    os.environ["DB_NAME"] = args.db_name
+    sys.path.insert(0, str(ROOT_DIR))
+    import server
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if not args.mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("In-memory mode needs mongomock-motor (pip install mongomock-motor), or pass --mongo-url")
+        server.client = AsyncMongoMockClient()
+        server.db = server.client[args.db_name]
+        server.analytics_db = server.db
+    return server
+
+
+async def seed(server, args):
+    """Seed colleges, students and an admin; returns what the workers need."""
+    db = server.db
+    await server.client.drop_database(args.db_name)
+
+    hashed = server.hash_password(BENCH_PASSWORD)
+    now = datetime.now(timezone.utc).isoformat()
+    colleges = []
+    students = []
+    for c in range(args.colleges):
+        college = {
+            "id": f"bench-college-{c}",
+            "name": f"Bench College {c}",
+            "yearbook_questions": ["Favorite memory?", "Proudest moment?", "Future plans?", "Message to friends?"],
+            "photo_slots": 4,
+            "created_at": now,
+        }
+        colleges.append(college)
+        batch = []
+        for s in range(args.students):
+            student = {
+                "id": f"bench-{c}-{s}",
+                "email": f"student{s}@college{c}.bench",
+                "hashed_password": hashed,
+                "user_type": "student",
+                "college_id": college["id"],
+                "profile": {"full_name": f"Student {c}-{s}"},
+                "yearbook_answers": {},
+                "photos": [],
+                "profile_completion": 0,
+                "created_at": now,
+            }
+            batch.append(student)
+            students.append({"id": student["id"], "email": student["email"], "college_id": college["id"]})
+        if batch:
+            await db.users.insert_many(batch)
+    await db.colleges.insert_many(colleges)
+
+    admin = {
+        "id": "bench-admin",
+        "email": "admin@bench.local",
+        "hashed_password": hashed,
+        "user_type": "admin",
+        "college_id": None,
+        "profile": {"full_name": "Bench Admin"},
+        "created_at": now,
+    }
+    await db.users.insert_one(admin)
+    # httpx's ASGITransport sends no lifespan events, so the startup hook never runs
+    await server.create_indexes()
+
+    tokens = {s["id"]: server.create_access_token({"sub": s["id"]}) for s in students}
+    tokens[admin["id"]] = server.create_access_token({"sub": admin["id"]})
+    return {"colleges": colleges, "students": students, "admin": admin, "tokens": tokens}
+
+
+class Scenarios:
+    """One coroutine per scenario; each returns a list of (route, status, seconds)."""
+
+    def __init__(self, client, data, rng, args):
+        self.client = client
+        self.data = data
+        self.rng = rng
+        self.args = args
+        self.photo = JPEG_HEADER + rng.randbytes(args.photo_kb * 1024 - len(JPEG_HEADER))
+        self.upload_seq = 0
+        self.by_college = {}
+        for student in data["students"]:
+            self.by_college.setdefault(student["college_id"], []).append(student)
+
+    def _auth(self, user_id):
+        return {"Authorization": f"Bearer {self.data['tokens'][user_id]}"}
+
+    async def _call(self, route, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        return route, response.status_code, time.perf_counter() - start
+
+    def _student(self):
+        return self.rng.choice(self.data["students"])
+
+    async def login(self):
+        student = self._student()
+        return [await self._call("POST /api/auth/login", "POST", "/api/auth/login",
+                                 json={"email": student["email"], "password": BENCH_PASSWORD})]
+
+    async def dashboard(self):
+        headers = self._auth(self._student()["id"])
+        return [
+            await self._call("GET /api/profile", "GET", "/api/profile", headers=headers),
+            await self._call("GET /api/college/directory", "GET", "/api/college/directory", headers=headers),
+            await self._call("GET /api/testimonials/received", "GET", "/api/testimonials/received", headers=headers),
+        ]
+
+    async def admin_students(self):
+        college = self.rng.choice(self.data["colleges"])
+        return [await self._call("GET /api/students", "GET", "/api/students",
+                                 params={"college_id": college["id"]}, headers=self._auth("bench-admin"))]
+
+    async def bulk_upload(self):
+        college = self.rng.choice(self.data["colleges"])
+        self.upload_seq += 1
+        students = [
+            {"name": f"Uploaded {self.upload_seq}-{i}", "email": f"upload{self.upload_seq}-{i}-{self.rng.random()}@bench.local"}
+            for i in range(self.args.bulk_size)
+        ]
+        return [await self._call("POST /api/students/bulk-upload", "POST", "/api/students/bulk-upload",
+                                 json={"college_id": college["id"], "students": students},
+                                 headers=self._auth("bench-admin"))]
+
+    async def photo_upload(self):
+        student = self._student()
+        files = {"file": ("bench.jpg", self.photo, "image/jpeg")}
+        return [await self._call("POST /api/photos/upload", "POST", "/api/photos/upload",
+                                 params={"slot_index": self.rng.randrange(4)}, files=files,
+                                 headers=self._auth(student["id"]))]
+
+    async def testimonial_write(self):
+        author = self._student()
+        target = self.rng.choice(self.by_college[author["college_id"]])
+        if target["id"] == author["id"]:
+            return []
+        return [await self._call("POST /api/testimonials", "POST", "/api/testimonials",
+                                 json={"to_student_id": target["id"], "text": "Thanks for all the great memories together!"},
+                                 headers=self._auth(author["id"]))]
+
+
+async def run_load(server, data, args):
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("The benchmark needs httpx (pip install httpx)")
+
+    mix = {name: weight for name, weight in SCENARIOS.items() if weight > 0 and name not in args.skip}
+    names, weights = list(mix), list(mix.values())
+    samples = []
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(worker_id):
+        rng = random.Random(args.seed + worker_id)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            scenarios = Scenarios(client, data, rng, args)
+            while time.perf_counter() < deadline:
+                scenario = rng.choices(names, weights)[0]
+                samples.extend(await getattr(scenarios, scenario)())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    by_route = {}
+    for route, status, seconds in samples:
+        by_route.setdefault(route, []).append((status, seconds))
+
+    routes = {}
+    for route, entries in sorted(by_route.items()):
+        latencies = sorted(s for _, s in entries)
+        errors = sum(1 for status, _ in entries if status >= 400)
+        routes[route] = {
+            "requests": len(entries),
+            "errors": errors,
+            "throughput_rps": round(len(entries) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+    return {
+        "total_requests": len(samples),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0,
+        "routes": routes,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    base_routes = (baseline or {}).get("summary", {}).get("routes", {})
+    print(f"\n{'route':40} {'reqs':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for route, r in report["summary"]["routes"].items():
+        line = f"{route:40} {r['requests']:7} {r['errors']:5} {r['throughput_rps']:8} {r['p50_ms']:9} {r['p99_ms']:9}"
+        base = base_routes.get(route)
+        if base and base["p50_ms"] and base["p99_ms"]:
+            line += f"   p50 {(r['p50_ms'] / base['p50_ms'] - 1) * 100:+.0f}%  p99 {(r['p99_ms'] / base['p99_ms'] - 1) * 100:+.0f}%"
+        print(line)
+    s = report["summary"]
+    print(f"\nTotal: {s['total_requests']} requests in {s['elapsed_s']}s ({s['throughput_rps']} req/s)")
+
+
+async def main(args):
+    server = load_app(args)
+    print(f"🚀 Seeding {args.colleges} colleges x {args.students} students...")
+    data = await seed(server, args)
+    print(f"🏃 Running {args.concurrency} clients for {args.duration}s...")
+    with gridfs_support(args):
+        samples, elapsed = await run_load(server, data, args)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "backend": "mongod" if args.mongo_url else "in-memory",
+            "params": {k: v for k, v in vars(args).items() if k not in ("compare", "output", "mongo_url")},
+        },
+        "summary": summarize(samples, elapsed),
+    }
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(report, baseline)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"📄 Results written to {args.output}")
+    server.client.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Yearbook API")
+    parser.add_argument("--mongo-url", help="Local mongod to run against (default: in-memory stand-in)")
+    parser.add_argument("--db-name", default="yearbook_bench")
+    parser.add_argument("--colleges", type=int, default=2)
+    parser.add_argument("--students", type=int, default=100, help="Students per college")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load")
+    parser.add_argument("--bulk-size", type=int, default=10, help="Students per bulk upload")
+    parser.add_argument("--photo-kb", type=int, default=200, help="Size of uploaded photos")
+    parser.add_argument("--skip", nargs="*", default=[], choices=list(SCENARIOS), help="Scenarios to leave out")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
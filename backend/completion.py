@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Profile completion scoring, and a batch job that repairs stored values.
+
+profile_completion is recomputed by the writes that change a student, so it
+goes stale when a college's questions or photo slots change, after imports
+of legacy data, or when the write that stores it fails. repair_completion
+walks the students of a college (or all of them) in id order, recomputes
+completion and writes only the values that differ, one bulk_write per
+batch. It is throttled to a document rate, and its progress is checkpointed
+in maintenance_jobs so an interrupted run resumes where it stopped:
+
+    python completion.py --college-id <id> --rate 2000
+    python completion.py --restart          # all colleges, from the start
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+import tenants
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_RATE = 2000  # students per second
+LEASE_SECONDS = 300
+
+SOURCE_PROJECTION = {"_id": 0, "id": 1, "college_id": 1, "profile": 1, "yearbook_answers": 1,
+                     "photos": 1, "profile_completion": 1}
+
+
+def calculate_profile_completion(user: Dict[str, Any], college: Dict[str, Any]) -> int:
+    score = 0
+    total = 4  # profile fields, yearbook answers, photos, basic info
+
+    # Check profile fields
+    profile = user.get("profile", {})
+    if all([profile.get("full_name"), profile.get("nickname"), profile.get("phone"), profile.get("date_of_birth")]):
+        score += 1
+
+    # Check yearbook answers
+    answers = user.get("yearbook_answers", {})
+    if len(answers) >= len(college.get("yearbook_questions", [])):
+        score += 1
+
+    # Check photos
+    photos = user.get("photos", [])
+    if len(photos) >= college.get("photo_slots", 4):
+        score += 1
+
+    # Basic info always filled
+    score += 1
+
+    return int((score / total) * 100)
+
+
+class JobBusy(Exception):
+    """Another worker holds the job's lease"""
+
+
+def job_id(college_id: Optional[str]) -> str:
+    return f"completion:{college_id or 'all'}"
+
+
+async def get_job(db, college_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    return await db.maintenance_jobs.find_one({"_id": job_id(college_id)}, {"_id": 0})
+
+
+async def _claim(db, college_id: Optional[str], restart: bool) -> Dict[str, Any]:
+    """Take the job's lease and return its checkpoint, starting over when finished or asked to"""
+    now = datetime.now(timezone.utc)
+    job = await db.maintenance_jobs.find_one({"_id": job_id(college_id)})
+    if job and job.get("status") == "running" and (job.get("lease_until") or "") > now.isoformat():
+        raise JobBusy(job_id(college_id))
+
+    fields = {"status": "running", "lease_until": (now + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+              "updated_at": now.isoformat(), "error": None}
+    if restart or not job or job.get("status") == "finished":
+        fields.update({"college_id": college_id, "last_id": None, "scanned": 0, "corrected": 0,
+                       "started_at": now.isoformat(), "finished_at": None})
+    # Guard on the lease we saw so two workers can't both claim it
+    guard = {"_id": job_id(college_id), "lease_until": job.get("lease_until")} if job else {"_id": job_id(college_id)}
+    try:
+        claimed = await db.maintenance_jobs.find_one_and_update(
+            guard, {"$set": fields}, upsert=not job, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError as e:  # another worker created the job first
+        raise JobBusy(job_id(college_id)) from e
+    if not claimed:
+        raise JobBusy(job_id(college_id))
+    return claimed
+
+
+async def repair_completion(db, college_id: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                            rate: float = DEFAULT_RATE, restart: bool = False) -> Dict[str, Any]:
+    """
+    Recompute profile_completion for a college's students, or every student.
+
+    Returns the job document with scanned and corrected counts. Raises
+    JobBusy if the job is already running elsewhere.
+    """
+    job = await _claim(db, college_id, restart)
+    colleges: Dict[str, Optional[Dict[str, Any]]] = {}
+    query: Dict[str, Any] = {"user_type": "student"}
+    if college_id:
+        query["college_id"] = college_id
+
+    try:
+        while True:
+            started = time.monotonic()
+            page = dict(query)
+            if job["last_id"] is not None:
+                page["id"] = {"$gt": job["last_id"]}
+            students = await db.users.find(page, SOURCE_PROJECTION).sort("id", 1).limit(batch_size).to_list(batch_size)
+            if not students:
+                break
+
+            missing = {s.get("college_id") for s in students} - colleges.keys()
+            if missing:
+                found = await db.colleges.find({"id": {"$in": list(missing)}}, {"_id": 0}).to_list(None)
+                colleges.update({cid: None for cid in missing})
+                colleges.update({c["id"]: c for c in found})
+
+            operations = []
+            for student in students:
+                college = colleges.get(student.get("college_id"))
+                if not college:
+                    continue
+                completion = calculate_profile_completion(student, college)
+                if completion != student.get("profile_completion"):
+                    # Only if no live write changed it since we read it
+                    operations.append(UpdateOne(
+                        tenants.scoped(student["college_id"], {"id": student["id"], "profile_completion": student.get("profile_completion")}),
+                        {"$set": {"profile_completion": completion}}
+                    ))
+            corrected = 0
+            if operations:
+                result = await db.users.bulk_write(operations, ordered=False)
+                corrected = result.modified_count
+
+            now = datetime.now(timezone.utc)
+            job = await db.maintenance_jobs.find_one_and_update(
+                {"_id": job["_id"]},
+                {"$set": {"last_id": students[-1]["id"], "updated_at": now.isoformat(),
+                          "lease_until": (now + timedelta(seconds=LEASE_SECONDS)).isoformat()},
+                 "$inc": {"scanned": len(students), "corrected": corrected}},
+                return_document=ReturnDocument.AFTER
+            )
+
+            # Throttle to `rate` students per second
+            delay = len(students) / rate - (time.monotonic() - started) if rate else 0
+            await asyncio.sleep(max(delay, 0))
+    except Exception as e:
+        await db.maintenance_jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "failed", "error": str(e), "lease_until": None}})
+        raise
+
+    now = datetime.now(timezone.utc).isoformat()
+    job = await db.maintenance_jobs.find_one_and_update(
+        {"_id": job["_id"]},
+        {"$set": {"status": "finished", "finished_at": now, "updated_at": now, "lease_until": None}},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    logger.info(f"Completion repair {job_id(college_id)}: {job['corrected']} of {job['scanned']} students corrected")
+    return job
+
+
+async def main(args):
+    from dotenv import load_dotenv
+    import database
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = database.create_client(os.environ['MONGO_URL'])
+    db = client[os.environ.get('DB_NAME', 'yearbook_db')]
+    try:
+        job = await repair_completion(db, args.college_id, args.batch_size, args.rate, args.restart)
+    except JobBusy:
+        raise SystemExit(f"{job_id(args.college_id)} is already running")
+    finally:
+        client.close()
+    print(f"✅ Scanned {job['scanned']} students, corrected {job['corrected']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute stored profile completion")
+    parser.add_argument("--college-id", help="Only this college (default: all students)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Students per second (0: unthrottled)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first student")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main(parse_args()))
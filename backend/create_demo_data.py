@@ -2,10 +2,20 @@
 """
 Script to create demo credentials and test data in MongoDB
 Run this script to populate your database with demo data for testing
+
+Scale mode seeds production-sized synthetic data for profiling and
+benchmark runs, e.g. one million students:
+
+    python create_demo_data.py --scale --colleges 100 --students-per-college 10000 \
+        --answer-fill 0.7 --photos 2 --photo-kb 50 --testimonial-density 3
 """
 
+import argparse
 import asyncio
 import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 from passlib.context import CryptContext
@@ -13,6 +23,9 @@ from datetime import datetime, timezone
 import secrets
 from pathlib import Path
 
+import uploads
+from completion import calculate_profile_completion
+
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -134,5 +147,205 @@ async def create_demo_data():
     finally:
         client.close()
 
+SCALE_QUESTIONS = [
+    "What is your favorite memory from college?",
+    "What are you most proud of?",
+    "Share your future aspirations:",
+    "A message to your friends:"
+]
+SCALE_ANSWERS = [
+    "Late nights in the library with friends",
+    "Finishing my final year project",
+    "Building something that matters",
+    "Thanks for the great memories!"
+]
+SCALE_TESTIMONIALS = [
+    "Always there when it mattered most. Never change!",
+    "The best lab partner anyone could ask for.",
+    "Thanks for every laugh and every late night.",
+    "You made these years unforgettable."
+]
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+# Synthetic photos need a real image header to pass the upload checks' content sniffing
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+
+async def _one_chunk(data: bytes):
+    yield data
+
+async def _insert_batches(collection, docs_iter, batch_size: int, max_in_flight: int):
+    """insert_many in fixed-size batches with a bounded number of batches in flight"""
+    in_flight = set()
+    inserted = 0
+    batch = []
+    
+    async def flush(docs):
+        await collection.insert_many(docs, ordered=False)
+        return len(docs)
+    
+    for doc in docs_iter:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            in_flight.add(asyncio.ensure_future(flush(batch)))
+            batch = []
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                inserted += sum(t.result() for t in done)
+    if batch:
+        in_flight.add(asyncio.ensure_future(flush(batch)))
+    if in_flight:
+        done, _ = await asyncio.wait(in_flight)
+        inserted += sum(t.result() for t in done)
+    return inserted
+
+async def create_scale_data(args):
+    """Seed a synthetic dataset sized by the command line flags"""
+    mongo_url = os.environ.get('MONGO_URL')
+    db_name = os.environ.get('DB_NAME', 'yearbook_db')
+    
+    if not mongo_url:
+        print("❌ Error: MONGO_URL not found in .env file")
+        return
+    
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    rng = random.Random(args.seed)
+    run_id = secrets.token_hex(3)
+    started = time.perf_counter()
+    
+    try:
+        # bcrypt is deliberately slow, so hash a small pool once, in parallel
+        print(f"🔐 Hashing {args.password_pool} passwords...")
+        passwords = [f"scale-{run_id}-{i}" for i in range(args.password_pool)]
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor() as pool:
+            hashes = await asyncio.gather(*(loop.run_in_executor(pool, _hash, p) for p in passwords))
+        
+        # A handful of random images shared by all students keeps generation cheap.
+        # They are stored in GridFS like uploads and handed out round-robin, so each
+        # one's references are known up front and taken before any student uses it.
+        # A rerun with the same --seed produces the same images and reuses their blobs.
+        photo_pool = []
+        total_slots = args.colleges * args.students_per_college * args.photos
+        pool_size = min(8, args.photos, total_slots)
+        for p in range(pool_size):
+            stored = await uploads.store_stream(db, _one_chunk(JPEG_HEADER + rng.randbytes(args.photo_kb * 1024)),
+                                                f"scale_{p}.jpg", {"seed": run_id})
+            refs = total_slots // pool_size + (p < total_slots % pool_size)
+            photo_pool.append(await uploads.register_stored(db, stored, refs))
+        now = datetime.now(timezone.utc).isoformat()
+        
+        colleges = [{
+            "id": secrets.token_urlsafe(16),
+            "name": f"Scale College {run_id}-{c}",
+            "yearbook_questions": SCALE_QUESTIONS,
+            "photo_slots": args.photo_slots,
+            "created_at": now
+        } for c in range(args.colleges)]
+        await db.colleges.insert_many(colleges)
+        print(f"✅ Created {len(colleges)} colleges")
+        
+        student_ids = {c["id"]: [secrets.token_urlsafe(16) for _ in range(args.students_per_college)] for c in colleges}
+        
+        def students():
+            slot_count = 0
+            for c, college in enumerate(colleges):
+                for n, student_id in enumerate(student_ids[college["id"]]):
+                    answers = {str(q): SCALE_ANSWERS[q] for q in range(len(SCALE_QUESTIONS)) if rng.random() < args.answer_fill}
+                    photos = []
+                    for slot in range(args.photos):
+                        stored = photo_pool[slot_count % len(photo_pool)]
+                        slot_count += 1
+                        photos.append({
+                            "slot_index": slot,
+                            "file_id": stored["file_id"],
+                            "file_url": uploads.photo_path(stored["file_id"]),
+                            "filename": f"photo_{slot}.jpg",
+                            "storage": "gridfs",
+                            "content_type": stored["content_type"],
+                            "size": stored["size"],
+                            "sha256": stored["sha256"],
+                            "uploaded_at": now
+                        })
+                    profile_full = rng.random() < args.answer_fill
+                    profile = {"full_name": f"Student {n}", "phone": "+1-555-0100"}
+                    if profile_full:
+                        profile.update({"nickname": f"S{n}", "date_of_birth": "2003-05-15"})
+                    student = {
+                        "id": student_id,
+                        "email": f"student{n}.c{c}.{run_id}@scale.yearbook",
+                        "name": f"Student {n}",
+                        "hashed_password": hashes[n % len(hashes)],
+                        "user_type": "student",
+                        "college_id": college["id"],
+                        "profile": profile,
+                        "yearbook_answers": answers,
+                        "photos": photos,
+                        "created_at": now
+                    }
+                    student["profile_completion"] = calculate_profile_completion(student, college)
+                    yield student
+        
+        count = await _insert_batches(db.users, students(), args.batch_size, args.concurrency)
+        print(f"✅ Created {count} students")
+        
+        def testimonials():
+            for college in colleges:
+                ids = student_ids[college["id"]]
+                if len(ids) < 2:
+                    continue
+                for n, author in enumerate(ids):
+                    # Density is the mean number of testimonials each student writes
+                    k = min(len(ids) - 1, int(rng.expovariate(1 / args.testimonial_density) + 0.5)) if args.testimonial_density else 0
+                    targets = [t for t in rng.sample(ids, k + 1) if t != author][:k]
+                    for target in targets:
+                        text = rng.choice(SCALE_TESTIMONIALS)
+                        yield {
+                            "college_id": college["id"],
+                            "from_student_id": author,
+                            "from_student_name": f"Student {n}",
+                            "to_student_id": target,
+                            "text": text,
+                            "word_count": len(text.split()),
+                            "created_at": now,
+                            "updated_at": now
+                        }
+        
+        count = await _insert_batches(db.testimonials, testimonials(), args.batch_size, args.concurrency)
+        print(f"✅ Created {count} testimonials")
+        
+        print("\n" + "="*50)
+        print(f"✨ Scale data created in {time.perf_counter() - started:.1f}s")
+        print(f"   Student passwords cycle through: {passwords[0]} ... {passwords[-1]}")
+        print("   (student N uses password index N % pool size)")
+        print("="*50)
+        
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+    finally:
+        client.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Populate MongoDB with demo or scale test data")
+    parser.add_argument("--scale", action="store_true", help="Generate a synthetic dataset instead of the demo accounts")
+    parser.add_argument("--colleges", type=int, default=10)
+    parser.add_argument("--students-per-college", type=int, default=1000)
+    parser.add_argument("--answer-fill", type=float, default=0.6, help="Share of yearbook answers and profile fields filled (0-1)")
+    parser.add_argument("--photos", type=int, default=2, help="Photos per student")
+    parser.add_argument("--photo-slots", type=int, default=4, help="Photo slots per college")
+    parser.add_argument("--photo-kb", type=int, default=50, help="Size of each photo")
+    parser.add_argument("--testimonial-density", type=float, default=3, help="Mean testimonials written per student")
+    parser.add_argument("--password-pool", type=int, default=16, help="Distinct bcrypt hashes to share between students")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per insert_many")
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many batches in flight")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    asyncio.run(create_demo_data())
+    args = parse_args()
+    if args.scale:
+        asyncio.run(create_scale_data(args))
+    else:
+        asyncio.run(create_demo_data())
@@ -0,0 +1,74 @@
+"""
+MongoDB client construction and read routing.
+
+Reads fall in two classes:
+
+- latency-critical: logins, a student's own profile, writes and the reads
+  that feed them. These use `db`, which reads from the primary.
+- analytical: admin list views, per-student testimonial dumps and college
+  graph aggregations, which can tolerate data a little behind. These use
+  `analytics_db`, which prefers secondaries within a bounded staleness, so
+  dashboard and export load stays off the primary that serves student
+  writes. On a standalone mongod both handles read from the same server.
+
+Pool size, timeouts and wire compression are set per deployment through
+MONGO_* environment variables; unset ones keep the connection string's or
+the driver's defaults.
+"""
+
+import logging
+import os
+from typing import Any, Dict
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import SecondaryPreferred
+
+logger = logging.getLogger(__name__)
+
+# Environment variable -> MongoClient keyword
+INT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_CONNECTING": "maxConnecting",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_ZLIB_LEVEL": "zlibCompressionLevel",
+}
+
+# MongoDB's lower bound for maxStalenessSeconds
+MIN_MAX_STALENESS_S = 90
+
+
+def client_options() -> Dict[str, Any]:
+    """MongoClient keyword options configured in the environment"""
+    options: Dict[str, Any] = {}
+    for env, option in INT_OPTIONS.items():
+        value = os.getenv(env)
+        if value:
+            options[option] = int(value)
+    compressors = os.getenv("MONGO_COMPRESSORS")
+    if compressors:
+        # Unavailable compressors (zstd needs zstandard, snappy needs python-snappy) are dropped by the driver with a warning
+        options["compressors"] = compressors
+    return options
+
+
+def analytical_read_preference() -> SecondaryPreferred:
+    max_staleness = int(os.getenv("MONGO_ANALYTICS_MAX_STALENESS_S", "120"))
+    return SecondaryPreferred(max_staleness=max(max_staleness, MIN_MAX_STALENESS_S))
+
+
+def create_client(mongo_url: str, **kwargs) -> AsyncIOMotorClient:
+    options = {**client_options(), **kwargs}
+    configured = {k: v for k, v in options.items() if k != "event_listeners"}
+    if configured:
+        logger.info(f"MongoDB client options: {configured}")
+    return AsyncIOMotorClient(mongo_url, **options)
+
+
+def analytics_database(client, name: str):
+    """Handle for analytical reads: secondaries preferred, bounded staleness"""
+    return client.get_database(name, read_preference=analytical_read_preference())
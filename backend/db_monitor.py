@@ -0,0 +1,188 @@
+"""
+MongoDB command monitoring: slow-query log and per-request query tracing.
+
+Every command is timed by a pymongo CommandListener and tagged with the id
+of the HTTP request that issued it. Commands slower than MONGO_SLOW_QUERY_MS
+are logged with the shape of their filter (field names and operators, never
+values). When QUERY_TRACE_TOKEN is set, a request whose X-Query-Trace
+header carries that token gets the list of commands it issued, with
+durations, in the X-Query-Trace response header; without a token tracing
+is off. The header is capped at MAX_TRACE_HEADER_BYTES, dropping the
+latest commands and marking the trace truncated.
+"""
+
+import json
+import logging
+import os
+import secrets
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger("db_monitor")
+
+SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+MAX_TRACED_QUERIES = 200
+# Proxies commonly reject response headers past 8-16 KB
+MAX_TRACE_HEADER_BYTES = 8192
+TRACE_HEADER = "x-query-trace"
+REQUEST_ID_HEADER = "x-request-id"
+
+# Keys holding the filter of each command we care about
+_FILTER_KEYS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+}
+
+
+class RequestTrace:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.queries: List[Dict[str, Any]] = []
+        self.truncated = False
+
+    def record(self, entry: Dict[str, Any]):
+        if len(self.queries) >= MAX_TRACED_QUERIES:
+            self.truncated = True
+            return
+        self.queries.append(entry)
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+def query_shape(value: Any) -> Any:
+    """Strip literal values from a filter, keeping field names and operators."""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(v, dict) for v in value):
+            return [query_shape(v) for v in value]
+        return ["?"]
+    return "?"
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Any:
+    if command_name in _FILTER_KEYS:
+        return query_shape(command.get(_FILTER_KEYS[command_name], {}))
+    if command_name == "aggregate":
+        return [query_shape(stage) if "$match" in stage else list(stage) for stage in command.get("pipeline", [])]
+    if command_name == "update":
+        return [query_shape(u.get("q", {})) for u in command.get("updates", [])[:5]]
+    if command_name == "delete":
+        return [query_shape(d.get("q", {})) for d in command.get("deletes", [])[:5]]
+    return None
+
+
+def _collection(command_name: str, command: Dict[str, Any]) -> Optional[str]:
+    target = command.get(command_name)
+    if command_name == "getMore":
+        target = command.get("collection")
+    return target if isinstance(target, str) else None
+
+
+class QueryTracer(monitoring.CommandListener):
+    """Times every command and logs the slow ones."""
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        entry = {
+            "command": event.command_name,
+            "collection": _collection(event.command_name, event.command),
+            "filter": command_shape(event.command_name, event.command),
+        }
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = entry
+
+    def _finish(self, event, ok: bool):
+        with self._lock:
+            entry = self._pending.pop((event.connection_id, event.request_id), None)
+        if entry is None:
+            return
+        entry["duration_ms"] = round(event.duration_micros / 1000, 3)
+        if not ok:
+            entry["failed"] = True
+
+        trace = current_trace.get()
+        if trace is not None:
+            trace.record(entry)
+
+        if entry["duration_ms"] >= self.slow_query_ms:
+            request_id = trace.request_id if trace else "-"
+            logger.warning(
+                f"Slow Mongo command {entry['command']} on {entry['collection']} took {entry['duration_ms']}ms "
+                f"request_id={request_id} filter={json.dumps(entry['filter'])}"
+            )
+
+    def succeeded(self, event):
+        self._finish(event, ok=True)
+
+    def failed(self, event):
+        self._finish(event, ok=False)
+
+
+def _trace_requested(headers: Dict[bytes, bytes]) -> bool:
+    value = headers.get(TRACE_HEADER.encode())
+    token = os.getenv("QUERY_TRACE_TOKEN")
+    if not value or not token:
+        return False
+    return secrets.compare_digest(value.decode("latin-1"), token)
+
+
+def trace_header(trace: RequestTrace, max_bytes: int = MAX_TRACE_HEADER_BYTES) -> bytes:
+    """The trace as compact JSON, keeping as many of the first queries as fit in max_bytes"""
+    def dump(queries, truncated):
+        payload = {"request_id": trace.request_id, "queries": queries, "truncated": truncated}
+        return json.dumps(payload, separators=(",", ":")).encode()
+
+    value = dump(trace.queries, trace.truncated)
+    if len(value) <= max_bytes:
+        return value
+    budget = max_bytes - len(dump([], True))
+    kept = 0
+    for entry in trace.queries:
+        budget -= len(json.dumps(entry, separators=(",", ":")).encode()) + 1  # and its comma
+        if budget < 0:
+            break
+        kept += 1
+    return dump(trace.queries[:kept], True)
+
+
+class QueryTraceMiddleware:
+    """ASGI middleware assigning a request id and returning query traces on demand."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(REQUEST_ID_HEADER.encode(), b"").decode("latin-1")[:64] or secrets.token_hex(8)
+        trace = RequestTrace(request_id)
+        want_trace = _trace_requested(headers)
+        token = current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response_headers = list(message.get("headers", []))
+                response_headers.append((REQUEST_ID_HEADER.encode(), request_id.encode("latin-1")))
+                if want_trace:
+                    response_headers.append((TRACE_HEADER.encode(), trace_header(trace)))
+                message = {**message, "headers": response_headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
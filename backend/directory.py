@@ -0,0 +1,174 @@
+"""
+Materialized per-college student directory.
+
+college_directory holds one small entry per student with only the fields
+the roster shows (name, nickname, thumbnail). Write paths that change those
+fields upsert the student's entry and bump the college's version in
+directory_versions. Readers check the version (one indexed read) and serve
+a cached snapshot of the whole roster, as JSON and precompressed with gzip,
+until the version moves.
+
+Colleges are built from users on first read. Only the build creates a
+version document, and writes skip colleges that have none, so a write can
+never stand in for the full build. The version document exists (not yet
+`ready`) while the build runs, so writes made meanwhile are kept.
+"""
+
+import gzip
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+MAX_CACHED_COLLEGES = 256
+
+# Fields read from users to build an entry
+SOURCE_PROJECTION = {"_id": 0, "id": 1, "college_id": 1, "user_type": 1, "name": 1,
+                     "profile.full_name": 1, "profile.nickname": 1, "photos": 1}
+
+
+class Snapshot:
+    def __init__(self, college_id: str, version: int, entries: List[Dict[str, Any]]):
+        self.college_id = college_id
+        self.version = version
+        self.entries = entries
+        self.body = json.dumps(entries, separators=(",", ":")).encode()
+        self.gzipped = gzip.compress(self.body, compresslevel=6)
+        self.etag = f'W/"{college_id}-{version}"'
+
+
+_cache: "OrderedDict[str, Snapshot]" = OrderedDict()
+
+
+def directory_entry(student: Dict[str, Any]) -> Dict[str, Any]:
+    """The display fields of a student, as shown in the college roster"""
+    profile = student.get("profile") or {}
+    # Photos kept outside the user document only; legacy data URLs are far too big for a roster
+    stored = sorted(
+        (p for p in student.get("photos") or [] if p.get("storage")),
+        key=lambda p: p.get("slot_index", 0)
+    )
+    return {
+        "id": student["id"],
+        "name": student.get("name") or profile.get("full_name") or "",
+        "nickname": profile.get("nickname"),
+        "thumbnail": stored[0]["file_url"] if stored else None,
+        "photo_count": len(student.get("photos") or []),
+    }
+
+
+async def _built(db, college_ids: Iterable[str]) -> set:
+    """The colleges among `college_ids` whose directory has been (or is being) built"""
+    docs = await db.directory_versions.find({"_id": {"$in": list(set(college_ids))}}, {"_id": 1}).to_list(None)
+    return {d["_id"] for d in docs}
+
+
+async def _bump(db, college_ids: Iterable[str]):
+    for college_id in set(college_ids):
+        await db.directory_versions.update_one({"_id": college_id}, {"$inc": {"version": 1}})
+
+
+async def upsert_students(db, students: List[Dict[str, Any]]):
+    """Refresh the entries of students whose display fields may have changed"""
+    students = [s for s in students if s.get("user_type", "student") == "student" and s.get("college_id")]
+    if not students:
+        return
+    # Colleges not built yet get every student from the build on first read
+    built = await _built(db, (s["college_id"] for s in students))
+    students = [s for s in students if s["college_id"] in built]
+    if not students:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    await db.college_directory.bulk_write([
+        UpdateOne(
+            {"college_id": s["college_id"], "id": s["id"]},
+            {"$set": {**directory_entry(s), "college_id": s["college_id"], "updated_at": now}},
+            upsert=True
+        )
+        for s in students
+    ], ordered=False)
+    await _bump(db, (s["college_id"] for s in students))
+
+
+async def remove_students(db, students: List[Dict[str, Any]]):
+    """Drop the entries of deleted students; each needs id and college_id"""
+    students = [s for s in students if s.get("college_id")]
+    if not students:
+        return
+    by_college: Dict[str, List[str]] = {}
+    for s in students:
+        by_college.setdefault(s["college_id"], []).append(s["id"])
+    for college_id, ids in by_college.items():
+        await db.college_directory.delete_many({"college_id": college_id, "id": {"$in": ids}})
+    await _bump(db, by_college)
+
+
+async def build(db, college_id: str) -> int:
+    """
+    Fill a college's entries from users and mark it ready; returns the new version.
+
+    Safe to run concurrently: entries are only inserted, never overwritten,
+    so entries written by live updates during the build win over the
+    build's older read.
+    """
+    try:
+        await db.directory_versions.update_one(
+            {"_id": college_id}, {"$setOnInsert": {"version": 0, "ready": False}}, upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # created by a concurrent build
+
+    students = await db.users.find({"college_id": college_id, "user_type": "student"}, SOURCE_PROJECTION).to_list(None)
+    now = datetime.now(timezone.utc).isoformat()
+    if students:
+        try:
+            await db.college_directory.bulk_write([
+                UpdateOne(
+                    {"college_id": college_id, "id": s["id"]},
+                    {"$setOnInsert": {**directory_entry(s), "college_id": college_id, "updated_at": now}},
+                    upsert=True
+                )
+                for s in students
+            ], ordered=False)
+        except BulkWriteError as e:
+            # Duplicate keys only mean a concurrent build or write inserted the entry first
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+    doc = await db.directory_versions.find_one_and_update(
+        {"_id": college_id}, {"$set": {"ready": True}, "$inc": {"version": 1}}, return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+
+async def get_snapshot(db, college_id: str) -> Snapshot:
+    """The college's current roster, from cache unless its version moved"""
+    doc = await db.directory_versions.find_one({"_id": college_id})
+    version = doc["version"] if doc and doc.get("ready") else await build(db, college_id)
+
+    cached = _cache.get(college_id)
+    if cached and cached.version == version:
+        _cache.move_to_end(college_id)
+        return cached
+
+    entries = await db.college_directory.find(
+        {"college_id": college_id}, {"_id": 0, "college_id": 0, "updated_at": 0}
+    ).sort("name", 1).to_list(None)
+    snapshot = Snapshot(college_id, version, entries)
+    _cache[college_id] = snapshot
+    _cache.move_to_end(college_id)
+    while len(_cache) > MAX_CACHED_COLLEGES:
+        _cache.popitem(last=False)
+    return snapshot
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    return bool(accept_encoding) and "gzip" in accept_encoding.lower()
+
+
+async def ensure_indexes(db):
+    await db.college_directory.create_index([("college_id", 1), ("id", 1)], unique=True)
+    await db.college_directory.create_index([("college_id", 1), ("name", 1)])
@@ -0,0 +1,112 @@
+"""
+Google Drive integration.
+
+Imported on first use by server.py: the Google API client libraries are
+slow to import and most requests never touch Drive, so keeping them out of
+server.py's import graph shortens cold starts and trims per-worker memory.
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseUpload
+from google_auth_oauthlib.flow import Flow
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request as GoogleRequest
+
+SCOPES = ['https://www.googleapis.com/auth/drive.file']
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Drive requires multiples of 256 KiB
+
+
+def redirect_uri() -> str:
+    return os.getenv("GOOGLE_DRIVE_REDIRECT_URI", f"{os.getenv('CORS_ORIGINS', '*').split(',')[0]}/api/drive/callback")
+
+
+def _flow(client_id: Optional[str], client_secret: Optional[str], scopes) -> Flow:
+    uri = redirect_uri()
+    return Flow.from_client_config(
+        {
+            "web": {
+                "client_id": client_id,
+                "client_secret": client_secret,
+                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                "token_uri": "https://oauth2.googleapis.com/token",
+                "redirect_uris": [uri]
+            }
+        },
+        scopes=scopes,
+        redirect_uri=uri
+    )
+
+
+def authorization_url(user_id: str, client_id: str, client_secret: str) -> str:
+    flow = _flow(client_id, client_secret, SCOPES)
+    url, state = flow.authorization_url(
+        access_type='offline',
+        include_granted_scopes='true',
+        prompt='consent',
+        state=user_id
+    )
+    return url
+
+
+async def store_credentials(db, code: str, user_id: str):
+    """Exchange the OAuth code for tokens and save them for the user"""
+    flow = _flow(os.getenv("GOOGLE_CLIENT_ID"), os.getenv("GOOGLE_CLIENT_SECRET"), None)
+    flow.fetch_token(code=code)
+    credentials = flow.credentials
+
+    await db.drive_credentials.update_one(
+        {"user_id": user_id},
+        {"$set": {
+            "user_id": user_id,
+            "access_token": credentials.token,
+            "refresh_token": credentials.refresh_token,
+            "token_uri": credentials.token_uri,
+            "client_id": credentials.client_id,
+            "client_secret": credentials.client_secret,
+            "scopes": credentials.scopes,
+            "expiry": credentials.expiry.isoformat() if credentials.expiry else None,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        upsert=True
+    )
+
+
+async def get_drive_service(db, user_id: str, creds_doc: Optional[Dict[str, Any]] = None):
+    """Build a Drive client from the user's stored credentials, refreshing them if expired"""
+    if creds_doc is None:
+        creds_doc = await db.drive_credentials.find_one({"user_id": user_id})
+    if not creds_doc:
+        return None
+
+    creds = Credentials(
+        token=creds_doc["access_token"],
+        refresh_token=creds_doc.get("refresh_token"),
+        token_uri=creds_doc["token_uri"],
+        client_id=creds_doc["client_id"],
+        client_secret=creds_doc["client_secret"],
+        scopes=creds_doc["scopes"]
+    )
+
+    if creds.expired and creds.refresh_token:
+        creds.refresh(GoogleRequest())
+        await db.drive_credentials.update_one(
+            {"user_id": user_id},
+            {"$set": {
+                "access_token": creds.token,
+                "expiry": creds.expiry.isoformat() if creds.expiry else None,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+
+    return build('drive', 'v3', credentials=creds)
+
+
+def upload_file(drive_service, name: str, stream, content_type: str) -> Tuple[str, str]:
+    """Upload a file object to Drive in resumable chunks; returns (file_id, web_view_link)"""
+    media = MediaIoBaseUpload(stream, mimetype=content_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    uploaded_file = drive_service.files().create(body={'name': name}, media_body=media, fields='id,webViewLink').execute()
+    return uploaded_file.get('id'), uploaded_file.get('webViewLink')
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Startup import-cost report for the backend.
+
+Imports server.py in a fresh interpreter under `python -X importtime` and
+breaks the cost down by top-level package, so cold-start regressions show
+up in CI. --forbid fails the run if a package that should load lazily (for
+example the Google Drive client) is imported at startup.
+
+    python import_report.py --top 15 --forbid googleapiclient --forbid google_auth_oauthlib
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+
+
+def measure(module: str):
+    """Return (self_us, cumulative_us, name) rows from -X importtime for `module`"""
+    env = {"MONGO_URL": "mongodb://localhost:27017", "DB_NAME": "import_report", **os.environ}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"❌ Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def by_package(rows):
+    totals = {}
+    for self_us, _, name in rows:
+        package = name.split(".")[0]
+        entry = totals.setdefault(package, {"self_ms": 0.0, "modules": 0})
+        entry["self_ms"] += self_us / 1000
+        entry["modules"] += 1
+    return dict(sorted(totals.items(), key=lambda kv: -kv[1]["self_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report backend import cost by package")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--forbid", action="append", default=[], help="Package that must not be imported at startup")
+    parser.add_argument("--json", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    packages = by_package(rows)
+    total_ms = sum(p["self_ms"] for p in packages.values())
+
+    print(f"📦 Importing {args.module}: {total_ms:.0f} ms across {len(rows)} modules")
+    print(f"\n{'package':32} {'ms':>9} {'share':>7} {'modules':>8}")
+    for package, entry in list(packages.items())[:args.top]:
+        print(f"{package:32} {entry['self_ms']:9.1f} {entry['self_ms'] / total_ms * 100:6.1f}% {entry['modules']:8}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"module": args.module, "total_ms": round(total_ms, 1), "packages": packages}, indent=2))
+
+    loaded = [p for p in args.forbid if p in packages]
+    if loaded:
+        sys.exit(f"\n❌ Imported at startup but should load lazily: {', '.join(loaded)}")
+
+
+if __name__ == "__main__":
+    main()
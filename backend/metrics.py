@@ -0,0 +1,234 @@
+"""
+Per-route request metrics exposed in Prometheus text format.
+
+The middleware records latency, response size, status codes and the number
+of MongoDB commands issued while serving each request, per route and per
+tenant (college) so a noisy neighbour stands out. Mongo commands are
+counted by a pymongo CommandListener; Motor runs driver calls inside a copy
+of the caller's context, so the listener sees the request that issued them.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+SAMPLE_WINDOW = 1024  # recent samples kept per route for quantile summaries
+# Distinct colleges given their own series; later ones are reported as "other"
+MAX_TENANTS = int(os.getenv("METRICS_MAX_TENANTS", "200"))
+
+
+class RequestStats:
+    """Mutable per-request state shared between the middleware and DB listeners."""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = None
+        self.tenant: Optional[str] = None  # college of the authenticated user, if any
+        self.db_commands: List[str] = []
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    idx = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+class _RouteMetrics:
+    def __init__(self):
+        self.count = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_samples = deque(maxlen=SAMPLE_WINDOW)
+        self.size_sum = 0
+        self.size_samples = deque(maxlen=SAMPLE_WINDOW)
+        self.db_sum = 0
+        self.db_samples = deque(maxlen=SAMPLE_WINDOW)
+        self.statuses: Dict[int, int] = defaultdict(int)
+
+    def observe(self, latency: float, size: int, status: int, db_commands: int):
+        self.count += 1
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.latency_buckets[i] += 1
+        self.latency_samples.append(latency)
+        self.size_sum += size
+        self.size_samples.append(size)
+        self.db_sum += db_commands
+        self.db_samples.append(db_commands)
+        self.statuses[status] += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], _RouteMetrics] = defaultdict(_RouteMetrics)
+        self._tenants: Dict[str, _RouteMetrics] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, latency: float, size: int, status: int, db_commands: int,
+                tenant: Optional[str] = None):
+        with self._lock:
+            self._routes[(method, route)].observe(latency, size, status, db_commands)
+            if tenant:
+                if tenant not in self._tenants and len(self._tenants) >= MAX_TENANTS:
+                    tenant = "other"
+                self._tenants.setdefault(tenant, _RouteMetrics()).observe(latency, size, status, db_commands)
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._tenants.clear()
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            snapshot = {key: m for key, m in self._routes.items()}
+            tenants = {key: m for key, m in self._tenants.items()}
+            lines = [
+                "# HELP http_requests_total Requests served, by route and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route), m in sorted(snapshot.items()):
+                for status, n in sorted(m.statuses.items()):
+                    lines.append(f'http_requests_total{{{_labels(method, route)},status="{status}"}} {n}')
+
+            lines += [
+                "# HELP http_request_duration_seconds Request latency histogram.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), m in sorted(snapshot.items()):
+                labels = _labels(method, route)
+                for bound, n in zip(LATENCY_BUCKETS, m.latency_buckets):
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {n}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m.count}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {m.latency_sum:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {m.count}")
+
+            lines += _summary(
+                "http_request_latency_seconds",
+                "Request latency quantiles over the most recent requests.",
+                snapshot, lambda m: (m.latency_samples, m.latency_sum),
+            )
+            lines += _summary(
+                "http_response_size_bytes",
+                "Response body size quantiles over the most recent requests.",
+                snapshot, lambda m: (m.size_samples, m.size_sum),
+            )
+            lines += _summary(
+                "http_request_db_commands",
+                "MongoDB commands issued per request.",
+                snapshot, lambda m: (m.db_samples, m.db_sum),
+            )
+
+            lines += [
+                "# HELP http_tenant_requests_total Authenticated requests served, by college and status code.",
+                "# TYPE http_tenant_requests_total counter",
+            ]
+            for tenant, m in sorted(tenants.items()):
+                for status, n in sorted(m.statuses.items()):
+                    lines.append(f'http_tenant_requests_total{{{_tenant_label(tenant)},status="{status}"}} {n}')
+            lines += _summary(
+                "http_tenant_request_latency_seconds",
+                "Request latency quantiles per college over its most recent requests.",
+                tenants, lambda m: (m.latency_samples, m.latency_sum), _tenant_label,
+            )
+            lines += _summary(
+                "http_tenant_request_db_commands",
+                "MongoDB commands issued per request, per college.",
+                tenants, lambda m: (m.db_samples, m.db_sum), _tenant_label,
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _labels(method: str, route: str) -> str:
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+def _tenant_label(tenant: str) -> str:
+    tenant = tenant.replace("\\", "\\\\").replace('"', '\\"')
+    return f'college="{tenant}"'
+
+
+def _summary(name: str, help_text: str, snapshot, select, label=lambda key: _labels(*key)) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+    for key, m in sorted(snapshot.items()):
+        labels = label(key)
+        samples, total = select(m)
+        values = sorted(samples)
+        for q in QUANTILES:
+            lines.append(f'{name}{{{labels},quantile="{q}"}} {_quantile(values, q)}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {m.count}")
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+class DbCommandCounter(monitoring.CommandListener):
+    """Attributes every MongoDB command to the request that issued it."""
+
+    def started(self, event):
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and recording it in the registry."""
+
+    def __init__(self, app, registry: MetricsRegistry = registry, exclude_paths=("/metrics",)):
+        self.app = app
+        self.registry = registry
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["method"], scope["path"])
+        token = current_request.set(stats)
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = scope.get("route")
+            stats.route = getattr(route, "path", None) or "unmatched"
+            self.registry.observe(
+                stats.method, stats.route, elapsed, size, status_code, len(stats.db_commands), stats.tenant
+            )
@@ -0,0 +1,209 @@
+"""
+Opt-in request profiling.
+
+An admin can profile a single request by sending the X-Profile header, and
+PROFILE_SAMPLE_RATE profiles a random fraction of all traffic. Profiles are
+taken with cProfile and kept in a bounded on-disk ring buffer as raw pstats
+(snakeviz, gprof2dot); collapsed stacks for flamegraph.pl or speedscope are
+derived from them on first download and cached next to them.
+
+cProfile only watches the event loop thread, so time spent waiting on Mongo
+shows up under the event loop's select call, while bcrypt, base64 and
+serialization show up as the functions doing the work. Only one request is
+profiled at a time; concurrent requests on the same loop are included in it.
+"""
+
+import asyncio
+import cProfile
+import json
+import logging
+import pstats
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from db_monitor import current_trace
+
+logger = logging.getLogger("profiling")
+
+PROFILE_HEADER = b"x-profile"
+MAX_STACK_DEPTH = 64
+# The call graph has exponentially many paths when many requests share it;
+# the walk follows the heaviest edges first and stops after this many nodes
+MAX_WALK_NODES = 50_000
+
+_profile_id_re = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def _func_name(func) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{Path(filename).name}:{line}:{name}"
+
+
+def collapsed_stacks(stats: pstats.Stats, max_nodes: int = MAX_WALK_NODES) -> List[str]:
+    """
+    Approximate collapsed stacks ("a;b;c <microseconds>") from a cProfile call graph.
+
+    cProfile records caller/callee edges rather than full stacks, so each
+    callee's time is split between its callers in proportion to the edge
+    cumulative times, the same approximation flameprof uses. The walk is
+    capped at max_nodes, so the lightest paths of large profiles are dropped.
+    """
+    raw = stats.stats
+    callees: Dict[Any, Dict[Any, float]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+    heaviest_first = {caller: sorted(edges.items(), key=lambda e: -e[1]) for caller, edges in callees.items()}
+
+    roots = sorted((func for func, entry in raw.items() if not entry[4]), key=lambda f: -raw[f][3])
+    totals: Dict[str, float] = {}
+    budget = max_nodes
+
+    def walk(func, stack, scale):
+        nonlocal budget
+        if budget <= 0:
+            return
+        budget -= 1
+        tt = raw[func][2]
+        stack = stack + [_func_name(func)]
+        key = ";".join(stack)
+        totals[key] = totals.get(key, 0.0) + tt * scale
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_ct in heaviest_first.get(func, []):
+            callee_ct = raw[callee][3]
+            if callee_ct <= 0 or _func_name(callee) in stack:
+                continue
+            walk(callee, stack, scale * edge_ct / callee_ct)
+
+    for root in roots:
+        walk(root, [], 1.0)
+
+    return [f"{stack} {int(seconds * 1_000_000)}" for stack, seconds in totals.items() if seconds * 1_000_000 >= 1]
+
+
+class ProfileStore:
+    """Bounded ring buffer of profiles on disk; the oldest are pruned first."""
+
+    def __init__(self, directory: Path, max_profiles: int):
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+
+    def save(self, profiler: cProfile.Profile, meta: Dict[str, Any]) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        route = re.sub(r"[^A-Za-z0-9]+", "-", meta["path"]).strip("-") or "root"
+        profile_id = f"{int(meta['started_at'] * 1000)}_{meta['request_id']}_{meta['method']}_{route}"[:120]
+        profile_id = re.sub(r"[^A-Za-z0-9_.-]", "-", profile_id)
+
+        pstats.Stats(profiler).dump_stats(self.directory / f"{profile_id}.prof")
+        (self.directory / f"{profile_id}.json").write_text(json.dumps({"id": profile_id, **meta}))
+
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        metas = sorted(self.directory.glob("*.json"))
+        for stale in metas[:max(0, len(metas) - self.max_profiles)]:
+            for suffix in (".json", ".prof", ".collapsed"):
+                stale.with_suffix(suffix).unlink(missing_ok=True)
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        if not self.directory.exists():
+            return []
+        metas = sorted(self.directory.glob("*.json"), reverse=True)[:limit]
+        profiles = []
+        for path in metas:
+            try:
+                profiles.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def path_for(self, profile_id: str, fmt: str) -> Optional[Path]:
+        """The profile's file in `fmt`, deriving collapsed stacks from the pstats on first use"""
+        suffix = {"collapsed": ".collapsed", "pstats": ".prof"}.get(fmt)
+        if not suffix or not _profile_id_re.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}{suffix}"
+        prof = path.with_suffix(".prof")
+        if fmt == "collapsed" and not path.exists() and prof.exists():
+            lines = collapsed_stacks(pstats.Stats(str(prof)))
+            partial = path.with_suffix(".collapsed.tmp")
+            partial.write_text("\n".join(lines) + "\n")
+            partial.replace(path)
+        return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests that carry X-Profile (for admins) or are sampled.
+
+    `authorize` receives the Authorization header value and decides whether
+    the caller may request a profile explicitly.
+    """
+
+    def __init__(self, app, store: ProfileStore, authorize: Callable[[Optional[str]], Awaitable[bool]],
+                 sample_rate: float = 0.0):
+        self.app = app
+        self.store = store
+        self.authorize = authorize
+        self.sample_rate = sample_rate
+        self._busy = False
+
+    async def _should_profile(self, headers: Dict[bytes, bytes]) -> Optional[str]:
+        if PROFILE_HEADER in headers:
+            authorization = headers.get(b"authorization", b"").decode("latin-1") or None
+            if await self.authorize(authorization):
+                return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await self._should_profile(dict(scope["headers"]))
+        # Re-check: the authorization lookup may have yielded to another request
+        if not reason or self._busy:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self._busy = True
+        profiler = cProfile.Profile()
+        started_at = time.time()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            self._busy = False
+            trace = current_trace.get()
+            meta = {
+                "request_id": trace.request_id if trace else "-",
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "reason": reason,
+                "started_at": started_at,
+                "duration_ms": round((time.time() - started_at) * 1000, 3),
+            }
+            try:
+                profile_id = await asyncio.to_thread(self.store.save, profiler, meta)
+                logger.info(f"Saved profile {profile_id} ({reason})")
+            except Exception as e:
+                logger.error(f"Failed to save profile: {str(e)}")
@@ -1,33 +1,41 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, UploadFile, File, Query
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, UploadFile, File, Form, Query, Request
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse, FileResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request as GoogleRequest
 import os
 import logging
 import secrets
 import string
 import csv
-import io
 from pathlib import Path
+from metrics import MetricsMiddleware, DbCommandCounter, current_request, registry as metrics_registry
+from db_monitor import QueryTraceMiddleware, QueryTracer
+from profiling import ProfilingMiddleware, ProfileStore
+from uploads import BodySizeLimitMiddleware
+import uploads
+import testimonial_queries
+import directory
+import tenants
+import database
+import completion
+from completion import calculate_profile_completion
+import asyncio
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = database.create_client(mongo_url, event_listeners=[DbCommandCounter(), QueryTracer()])
 db = client[os.environ['DB_NAME']]
+# Admin lists and reports: may read from a secondary (see database.py)
+analytics_db = database.analytics_database(client, os.environ['DB_NAME'])
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -35,9 +43,21 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
+# Photo batch uploads
+MAX_BATCH_PHOTOS = 10
+PHOTO_BATCH_PARALLELISM = 4
+PHOTO_WRITE_RETRIES = 5
+# Concurrent guarded photo writes per bulk batch
+BULK_PHOTO_WRITE_PARALLELISM = 16
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
+profile_store = ProfileStore(
+    Path(os.getenv("PROFILE_DIR", str(ROOT_DIR / "profiles"))),
+    max_profiles=int(os.getenv("PROFILE_MAX_FILES", "50"))
+)
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -65,10 +85,36 @@ class College(BaseModel):
     photo_slots: int
     created_at: str
 
+class TenantLimits(BaseModel):
+    max_students: Optional[int] = Field(None, ge=0)
+    max_list_size: Optional[int] = Field(None, ge=1)
+    daily_upload_bytes: Optional[int] = Field(None, ge=0)
+    daily_testimonials: Optional[int] = Field(None, ge=0)
+
 class StudentBulkUpload(BaseModel):
     college_id: str
     students: List[Dict[str, str]]  # [{"name": "...", "email": "..."}]
 
+class StudentSelection(BaseModel):
+    """Students targeted by a bulk admin operation: explicit ids and/or a filter"""
+    ids: Optional[List[str]] = None
+    college_id: Optional[str] = None
+    completion_below: Optional[int] = None
+
+class BulkStudentUpdate(StudentSelection):
+    profile: Optional[Dict[str, Any]] = None
+    yearbook_answers: Optional[Dict[str, str]] = None
+
+class BulkStudentReset(StudentSelection):
+    yearbook_answers: bool = True
+    photos: bool = True
+    testimonials: bool = False
+
+class CompletionRepairRequest(BaseModel):
+    college_id: Optional[str] = None
+    restart: bool = False
+    rate: float = Field(completion.DEFAULT_RATE, ge=0)
+
 class StudentProfile(BaseModel):
     full_name: Optional[str] = None
     nickname: Optional[str] = None
@@ -83,6 +129,13 @@ class PhotoUpload(BaseModel):
     file_id: str
     file_url: str
 
+class PhotoUploadSessionCreate(BaseModel):
+    slot_index: int
+    filename: str
+    content_type: str
+    size: int = Field(gt=0)
+    sha256: Optional[str] = None  # lets a photo already used in the student's college skip the upload
+
 class Testimonial(BaseModel):
     from_student_id: str
     to_student_id: str
@@ -136,34 +189,14 @@ async def get_current_user(authorization: str = Header(None)) -> Dict[str, Any]:
         user = await db.users.find_one({"id": user_id}, {"_id": 0})
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
+        # Attribute the request to the user's college in the per-tenant metrics
+        stats = current_request.get()
+        if stats is not None:
+            stats.tenant = user.get("college_id")
         return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def calculate_profile_completion(user: Dict[str, Any], college: Dict[str, Any]) -> int:
-    score = 0
-    total = 4  # profile fields, yearbook answers, photos, basic info
-    
-    # Check profile fields
-    profile = user.get("profile", {})
-    if all([profile.get("full_name"), profile.get("nickname"), profile.get("phone"), profile.get("date_of_birth")]):
-        score += 1
-    
-    # Check yearbook answers
-    answers = user.get("yearbook_answers", {})
-    if len(answers) >= len(college.get("yearbook_questions", [])):
-        score += 1
-    
-    # Check photos
-    photos = user.get("photos", [])
-    if len(photos) >= college.get("photo_slots", 4):
-        score += 1
-    
-    # Basic info always filled
-    score += 1
-    
-    return int((score / total) * 100)
-
 # Routes
 @api_router.get("/")
 async def root():
@@ -199,7 +232,10 @@ async def register(register_data: RegisterRequest):
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
+    if user["user_type"] == "student" and user["college_id"]:
+        await tenants.check_student_quota(db, user["college_id"], 1)
     await db.users.insert_one(user)
+    await directory.upsert_students(db, [user])
     
     access_token = create_access_token(data={"sub": user["id"]})
     user_data = {k: v for k, v in user.items() if k != "hashed_password"}
@@ -248,6 +284,34 @@ async def get_colleges(user = Depends(get_current_user)):
     colleges = await db.colleges.find({}, {"_id": 0}).to_list(1000)
     return [College(**c) for c in colleges]
 
+@api_router.put("/colleges/{college_id}/limits")
+async def update_college_limits(college_id: str, limits: TenantLimits, user = Depends(get_current_user)):
+    """Override the default tenant limits for one college; null clears an override (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can change college limits")
+    
+    update = {"$set": {}, "$unset": {}}
+    for name, value in limits.model_dump().items():
+        if value is None:
+            update["$unset"][f"limits.{name}"] = ""
+        else:
+            update["$set"][f"limits.{name}"] = value
+    result = await db.colleges.update_one({"id": college_id}, {k: v for k, v in update.items() if v})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="College not found")
+    
+    tenants.invalidate(college_id)
+    return await tenants.usage(db, college_id)
+
+@api_router.get("/colleges/{college_id}/usage")
+async def get_college_usage(college_id: str, user = Depends(get_current_user)):
+    """Student count, today's uploads and testimonials, and the limits in force for a college (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view college usage")
+    if not await db.colleges.find_one({"id": college_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="College not found")
+    return await tenants.usage(db, college_id)
+
 @api_router.post("/students/bulk-upload/debug")
 async def debug_bulk_upload(upload_data: StudentBulkUpload, user = Depends(get_current_user)):
     """Debug endpoint to see exactly what data is being received"""
@@ -276,7 +340,6 @@ async def bulk_upload_students(upload_data: StudentBulkUpload, user = Depends(ge
     logger.info(f"=== BULK UPLOAD START ===")
     logger.info(f"College ID: {upload_data.college_id}")
     logger.info(f"Students count: {len(upload_data.students)}")
-    logger.info(f"Students data: {upload_data.students}")
     
     college = await db.colleges.find_one({"id": upload_data.college_id}, {"_id": 0})
     if not college:
@@ -288,8 +351,12 @@ async def bulk_upload_students(upload_data: StudentBulkUpload, user = Depends(ge
         raise HTTPException(status_code=400, detail="No students provided for upload")
     
     created_students = []
+    inserted = []
+    valid_rows = []
+    seen_emails = set()
     skipped_count = 0
     
+    # Validate every row first, so the quota only counts students that will be created
     for idx, student_data in enumerate(upload_data.students):
         # Validate required fields (name and email are mandatory)
         name = student_data.get("name", "").strip()
@@ -300,7 +367,18 @@ async def bulk_upload_students(upload_data: StudentBulkUpload, user = Depends(ge
             logger.warning(f"Skipping student {idx}: missing name or email")
             skipped_count += 1
             continue
-            
+        
+        if email in seen_emails or await db.users.find_one({"email": email}, {"_id": 1}):
+            logger.warning(f"Student with email {email} already exists, skipping")
+            skipped_count += 1
+            continue
+        seen_emails.add(email)
+        valid_rows.append((name, email, phone))
+    
+    if valid_rows:
+        await tenants.check_student_quota(db, upload_data.college_id, len(valid_rows))
+    
+    for name, email, phone in valid_rows:
         password = generate_random_password()
         student = {
             "id": secrets.token_urlsafe(16),
@@ -320,14 +398,9 @@ async def bulk_upload_students(upload_data: StudentBulkUpload, user = Depends(ge
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         
-        existing = await db.users.find_one({"email": email})
-        if existing:
-            logger.warning(f"Student with email {email} already exists, skipping")
-            skipped_count += 1
-            continue
-            
         try:
             await db.users.insert_one(student)
+            inserted.append(student)
             created_students.append({
                 "name": name,
                 "email": email,
@@ -337,6 +410,8 @@ async def bulk_upload_students(upload_data: StudentBulkUpload, user = Depends(ge
             logger.error(f"Failed to insert student {email}: {str(e)}")
             skipped_count += 1
     
+    await directory.upsert_students(db, inserted)
+    
     if len(created_students) == 0:
         raise HTTPException(
             status_code=400, 
@@ -354,19 +429,25 @@ async def get_students(college_id: Optional[str] = None, user = Depends(get_curr
     if college_id:
         query["college_id"] = college_id
     
-    students = await db.users.find(query, {"_id": 0, "hashed_password": 0}).to_list(1000)
+    limits = await tenants.get_limits(db, college_id)
+    students = await analytics_db.users.find(query, {"_id": 0, "hashed_password": 0}).to_list(limits["max_list_size"])
     
-    # Update completion percentages
+    # Update completion percentages; only changed values are written, to the primary
+    colleges = await load_colleges(s["college_id"] for s in students if s.get("college_id"))
+    operations = []
     for student in students:
-        if student.get("college_id"):
-            college = await db.colleges.find_one({"id": student["college_id"]}, {"_id": 0})
-            if college:
-                completion = calculate_profile_completion(student, college)
-                await db.users.update_one(
-                    {"id": student["id"]},
+        college = colleges.get(student.get("college_id"))
+        if college:
+            completion = calculate_profile_completion(student, college)
+            if completion != student.get("profile_completion"):
+                # The read may be stale; skip students a live write has updated since
+                operations.append(UpdateOne(
+                    tenants.scoped(student["college_id"], {"id": student["id"], "profile_completion": student.get("profile_completion")}),
                     {"$set": {"profile_completion": completion}}
-                )
-                student["profile_completion"] = completion
+                ))
+            student["profile_completion"] = completion
+    if operations:
+        await db.users.bulk_write(operations, ordered=False)
     
     return students
 
@@ -394,22 +475,14 @@ async def get_student_detail(student_id: str, user = Depends(get_current_user)):
         "college": college
     }
 
-@api_router.put("/students/{student_id}")
-async def update_student(student_id: str, update_data: dict, user = Depends(get_current_user)):
-    """Update student profile (admin only)"""
-    if user["user_type"] != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can update students")
-    
-    student = await db.users.find_one({"id": student_id, "user_type": "student"}, {"_id": 0})
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
+def student_update_fields(update_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate an admin update into a $set document"""
     # Only allow updating specific fields to prevent privilege escalation
     allowed_fields = ["profile", "yearbook_answers"]
     update_dict = {}
     
     for field in allowed_fields:
-        if field in update_data:
+        if update_data.get(field) is not None:
             if field == "profile":
                 # Update nested profile fields
                 for key, value in update_data[field].items():
@@ -417,23 +490,37 @@ async def update_student(student_id: str, update_data: dict, user = Depends(get_
             else:
                 update_dict[field] = update_data[field]
     
+    return update_dict
+
+@api_router.put("/students/{student_id}")
+async def update_student(student_id: str, update_data: dict, user = Depends(get_current_user)):
+    """Update student profile (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can update students")
+    
+    student = await db.users.find_one({"id": student_id, "user_type": "student"}, {"_id": 0})
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    
+    update_dict = student_update_fields(update_data)
     if not update_dict:
         raise HTTPException(status_code=400, detail="No valid fields to update")
     
     await db.users.update_one(
-        {"id": student_id},
+        tenants.scoped(student["college_id"], {"id": student_id}),
         {"$set": update_dict}
     )
     
     # Recalculate profile completion
-    updated_student = await db.users.find_one({"id": student_id}, {"_id": 0})
+    updated_student = await db.users.find_one(tenants.scoped(student["college_id"], {"id": student_id}), {"_id": 0})
     college = await db.colleges.find_one({"id": updated_student["college_id"]}, {"_id": 0})
     completion = calculate_profile_completion(updated_student, college)
     
     await db.users.update_one(
-        {"id": student_id},
+        tenants.scoped(student["college_id"], {"id": student_id}),
         {"$set": {"profile_completion": completion}}
     )
+    await directory.upsert_students(db, [updated_student])
     
     return {"success": True, "message": "Student updated successfully"}
 
@@ -448,19 +535,271 @@ async def delete_student(student_id: str, user = Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Student not found")
     
     # Delete all testimonials related to this student (both written and received)
-    await db.testimonials.delete_many({"$or": [
-        {"from_student_id": student_id},
-        {"to_student_id": student_id}
-    ]})
+    await delete_student_testimonials([student])
     
     # Delete the student
-    result = await db.users.delete_one({"id": student_id})
+    result = await db.users.delete_one(tenants.scoped(student["college_id"], {"id": student_id}))
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=500, detail="Failed to delete student")
+    await directory.remove_students(db, [student])
+    
+    # Release the student's stored photos; files no other slot uses are deleted
+    for photo in student.get("photos", []):
+        await uploads.release_photo(db, photo)
     
     return {"success": True, "message": "Student deleted successfully"}
 
+BULK_BATCH_SIZE = 1000
+
+async def select_students(selection: StudentSelection, projection: Dict[str, Any]):
+    """
+    Resolve a bulk selection to student documents, batch by batch.
+
+    Yields (students, missing_ids) per batch; missing_ids are requested ids
+    that matched no student.
+    """
+    if not selection.ids and not selection.college_id:
+        raise HTTPException(status_code=400, detail="Select students by ids or college_id")
+    
+    query: Dict[str, Any] = {"user_type": "student"}
+    if selection.college_id:
+        query["college_id"] = selection.college_id
+    if selection.completion_below is not None:
+        query["profile_completion"] = {"$lt": selection.completion_below}
+    
+    if selection.ids:
+        ids = list(dict.fromkeys(selection.ids))
+        for i in range(0, len(ids), BULK_BATCH_SIZE):
+            chunk = ids[i:i + BULK_BATCH_SIZE]
+            students = await db.users.find({**query, "id": {"$in": chunk}}, projection).to_list(None)
+            found = {s["id"] for s in students}
+            yield students, [sid for sid in chunk if sid not in found]
+    else:
+        cursor = db.users.find(query, projection).batch_size(BULK_BATCH_SIZE)
+        batch = []
+        async for student in cursor:
+            batch.append(student)
+            if len(batch) >= BULK_BATCH_SIZE:
+                yield batch, []
+                batch = []
+        if batch:
+            yield batch, []
+
+async def delete_student_testimonials(students: List[Dict[str, Any]]) -> int:
+    """Delete testimonials written by or for the students, one college at a time"""
+    deleted = 0
+    for college_id, ids in tenants.by_college(students).items():
+        result = await db.testimonials.delete_many(tenants.scoped(college_id, {"$or": [
+            {"from_student_id": {"$in": ids}},
+            {"to_student_id": {"$in": ids}}
+        ]}))
+        deleted += result.deleted_count
+    return deleted
+
+async def load_colleges(college_ids) -> Dict[str, Dict[str, Any]]:
+    colleges = await db.colleges.find({"id": {"$in": list(set(college_ids))}}, {"_id": 0}).to_list(None)
+    return {c["id"]: c for c in colleges}
+
+async def rewrite_students(selection: StudentSelection, change, after_batch=None) -> Dict[str, Any]:
+    """
+    Apply `change(student)` -> ($set document, merged student, replaced photos) to
+    every selected student, recomputing completion on the way.
+
+    Changes that leave photos alone go out in one bulk_write per batch. Photo
+    changes are guarded on photos_rev like set_photo_slots, one write per
+    student so conflicts are known: a student whose photos changed since the
+    read is re-read and retried, and reported as a conflict if that keeps
+    failing. Replaced photos are released only once their write has landed.
+    `after_batch(students)` runs after each batch is written.
+    """
+    projection = {"_id": 0, "id": 1, "name": 1, "college_id": 1, "profile": 1, "yearbook_answers": 1, "photos": 1,
+                  "photos_rev": 1}
+    results = []
+    modified = 0
+    semaphore = asyncio.Semaphore(BULK_PHOTO_WRITE_PARALLELISM)
+    
+    def prepare(student, colleges):
+        set_fields, merged, replaced = change(student)
+        college = colleges.get(student.get("college_id"))
+        if college:
+            set_fields["profile_completion"] = calculate_profile_completion(merged, college)
+        return set_fields, merged, replaced
+    
+    async def write_photos(student, colleges):
+        """Returns (status, merged student, replaced photos, modified)"""
+        key = tenants.scoped(student.get("college_id"), {"id": student["id"]})
+        async with semaphore:
+            for _ in range(PHOTO_WRITE_RETRIES):
+                set_fields, merged, replaced = prepare(student, colleges)
+                result = await db.users.update_one(
+                    {**key, "photos_rev": student.get("photos_rev")},
+                    {"$set": set_fields, "$inc": {"photos_rev": 1}}
+                )
+                if result.matched_count:
+                    return "updated", merged, replaced, result.modified_count
+                student = await db.users.find_one({**key, "user_type": "student"}, projection)
+                if not student:
+                    return "not_found", None, [], 0
+            return "conflict", None, [], 0
+    
+    async for students, missing in select_students(selection, projection):
+        results += [{"id": sid, "status": "not_found"} for sid in missing]
+        if not students:
+            continue
+        colleges = await load_colleges(s.get("college_id") for s in students)
+        operations = []
+        guarded = []
+        released = []
+        changed = []
+        
+        for student in students:
+            set_fields, merged, replaced = prepare(student, colleges)
+            if "photos" in set_fields:
+                guarded.append(student)
+                continue
+            if set_fields:
+                operations.append(UpdateOne(tenants.scoped(student.get("college_id"), {"id": student["id"]}), {"$set": set_fields}))
+                changed.append(merged)
+            results.append({"id": student["id"], "status": "updated"})
+        
+        if operations:
+            result = await db.users.bulk_write(operations, ordered=False)
+            modified += result.modified_count
+        for student, (status, merged, replaced, count) in zip(
+            guarded, await asyncio.gather(*(write_photos(s, colleges) for s in guarded))
+        ):
+            results.append({"id": student["id"], "status": status})
+            if merged:
+                changed.append(merged)
+            released += replaced
+            modified += count
+        await directory.upsert_students(db, changed)
+        await uploads.release_photos(db, released)
+        if after_batch:
+            await after_batch(students)
+    
+    updated = sum(1 for r in results if r["status"] == "updated")
+    conflicts = sum(1 for r in results if r["status"] == "conflict")
+    return {"success": not conflicts, "matched_count": updated, "modified_count": modified, "results": results}
+
+@api_router.post("/students/bulk-update")
+async def bulk_update_students(update_data: BulkStudentUpdate, user = Depends(get_current_user)):
+    """Apply the same profile/yearbook answer changes to many students (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can update students")
+    
+    update_dict = student_update_fields(update_data.model_dump())
+    if not update_dict:
+        raise HTTPException(status_code=400, detail="No valid fields to update")
+    
+    def change(student):
+        merged = {
+            **student,
+            "profile": {**(student.get("profile") or {}), **(update_data.profile or {})},
+            "yearbook_answers": update_data.yearbook_answers if update_data.yearbook_answers is not None else student.get("yearbook_answers", {})
+        }
+        return dict(update_dict), merged, []
+    
+    return await rewrite_students(update_data, change)
+
+@api_router.post("/students/bulk-reset")
+async def bulk_reset_students(reset_data: BulkStudentReset, user = Depends(get_current_user)):
+    """Clear yearbook answers, photos and optionally testimonials for many students (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can reset students")
+    if not (reset_data.yearbook_answers or reset_data.photos or reset_data.testimonials):
+        raise HTTPException(status_code=400, detail="Nothing to reset")
+    
+    def change(student):
+        set_fields = {}
+        replaced = []
+        if reset_data.yearbook_answers:
+            set_fields["yearbook_answers"] = {}
+        if reset_data.photos:
+            set_fields["photos"] = []
+            replaced = student.get("photos", [])
+        return set_fields, {**student, **set_fields}, replaced
+    
+    deleted = 0
+    
+    async def reset_testimonials(students):
+        nonlocal deleted
+        deleted += await delete_student_testimonials(students)
+    
+    response = await rewrite_students(reset_data, change, reset_testimonials if reset_data.testimonials else None)
+    if reset_data.testimonials:
+        response["testimonials_deleted"] = deleted
+    
+    return response
+
+@api_router.post("/students/bulk-delete")
+async def bulk_delete_students(selection: StudentSelection, user = Depends(get_current_user)):
+    """Delete many students with their testimonials, photos, Drive credentials and uploads (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can delete students")
+    
+    results = []
+    counts = {"users": 0, "testimonials": 0, "drive_credentials": 0}
+    
+    async for students, missing in select_students(selection, {"_id": 0, "id": 1, "college_id": 1, "photos": 1}):
+        results += [{"id": sid, "status": "not_found"} for sid in missing]
+        if not students:
+            continue
+        ids = [s["id"] for s in students]
+        
+        counts["testimonials"] += await delete_student_testimonials(students)
+        result = await db.drive_credentials.delete_many({"user_id": {"$in": ids}})
+        counts["drive_credentials"] += result.deleted_count
+        await uploads.discard_user_sessions(db, ids)
+        
+        for college_id, college_ids in tenants.by_college(students).items():
+            result = await db.users.delete_many(tenants.scoped(college_id, {"id": {"$in": college_ids}, "user_type": "student"}))
+            counts["users"] += result.deleted_count
+        results += [{"id": sid, "status": "deleted"} for sid in ids]
+        await directory.remove_students(db, students)
+        
+        await uploads.release_photos(db, [p for s in students for p in s.get("photos", [])])
+    
+    return {"success": True, "deleted": counts, "results": results}
+
+# Running repair jobs; kept referenced so they aren't garbage collected mid-run
+repair_tasks = set()
+
+async def run_completion_repair(repair: CompletionRepairRequest):
+    try:
+        await completion.repair_completion(db, repair.college_id, rate=repair.rate, restart=repair.restart)
+    except completion.JobBusy:
+        logger.info(f"{completion.job_id(repair.college_id)} is already running")
+    except Exception as e:
+        logger.error(f"Completion repair {completion.job_id(repair.college_id)} failed: {str(e)}")
+
+@api_router.post("/maintenance/completion-repair", status_code=202)
+async def start_completion_repair(repair: CompletionRepairRequest, user = Depends(get_current_user)):
+    """Recompute stored profile completion in the background, resuming from the last checkpoint (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can repair profile completion")
+    
+    job = await completion.get_job(db, repair.college_id)
+    if job and job["status"] == "running" and (job.get("lease_until") or "") > datetime.now(timezone.utc).isoformat():
+        raise HTTPException(status_code=409, detail="A repair for this selection is already running")
+    
+    task = asyncio.create_task(run_completion_repair(repair))
+    repair_tasks.add(task)
+    task.add_done_callback(repair_tasks.discard)
+    return {"success": True, "job_id": completion.job_id(repair.college_id)}
+
+@api_router.get("/maintenance/completion-repair")
+async def get_completion_repair(college_id: Optional[str] = None, user = Depends(get_current_user)):
+    """Progress of a completion repair: status, last checkpoint, scanned and corrected counts (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view repair jobs")
+    
+    job = await completion.get_job(db, college_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No repair has run for this selection")
+    return job
+
 @api_router.get("/profile")
 async def get_profile(user = Depends(get_current_user)):
     college = None
@@ -483,18 +822,19 @@ async def update_profile(profile_data: StudentProfile, user = Depends(get_curren
     update_data = profile_data.model_dump(exclude_none=True)
     
     await db.users.update_one(
-        {"id": user["id"]},
+        tenants.scoped(user["college_id"], {"id": user["id"]}),
         {"$set": {f"profile.{k}": v for k, v in update_data.items()}}
     )
     
-    updated_user = await db.users.find_one({"id": user["id"]}, {"_id": 0})
+    updated_user = await db.users.find_one(tenants.scoped(user["college_id"], {"id": user["id"]}), {"_id": 0})
     college = await db.colleges.find_one({"id": user["college_id"]}, {"_id": 0})
     completion = calculate_profile_completion(updated_user, college)
     
     await db.users.update_one(
-        {"id": user["id"]},
+        tenants.scoped(user["college_id"], {"id": user["id"]}),
         {"$set": {"profile_completion": completion}}
     )
+    await directory.upsert_students(db, [updated_user])
     
     return {"success": True, "profile_completion": completion}
 
@@ -504,16 +844,16 @@ async def update_yearbook_answers(answers: YearbookAnswers, user = Depends(get_c
         raise HTTPException(status_code=403, detail="Only students can update yearbook answers")
     
     await db.users.update_one(
-        {"id": user["id"]},
+        tenants.scoped(user["college_id"], {"id": user["id"]}),
         {"$set": {"yearbook_answers": {str(k): v for k, v in answers.answers.items()}}}
     )
     
-    updated_user = await db.users.find_one({"id": user["id"]}, {"_id": 0})
+    updated_user = await db.users.find_one(tenants.scoped(user["college_id"], {"id": user["id"]}), {"_id": 0})
     college = await db.colleges.find_one({"id": user["college_id"]}, {"_id": 0})
     completion = calculate_profile_completion(updated_user, college)
     
     await db.users.update_one(
-        {"id": user["id"]},
+        tenants.scoped(user["college_id"], {"id": user["id"]}),
         {"$set": {"profile_completion": completion}}
     )
     
@@ -525,17 +865,32 @@ async def get_college_students(user = Depends(get_current_user)):
     if user["user_type"] != "student":
         raise HTTPException(status_code=403, detail="Only students can view college students")
     
-    # Get all students from the same college, excluding the current user
-    students = await db.users.find(
-        {
-            "college_id": user["college_id"],
-            "user_type": "student",
-            "id": {"$ne": user["id"]}
-        },
-        {"_id": 0, "hashed_password": 0, "plain_password": 0}
-    ).to_list(1000)
-    
-    return students
+    # Served from the college's directory snapshot, excluding the current user
+    snapshot = await directory.get_snapshot(db, user["college_id"])
+    limits = await tenants.get_limits(db, user["college_id"])
+    return [entry for entry in snapshot.entries if entry["id"] != user["id"]][:limits["max_list_size"]]
+
+@api_router.get("/college/directory")
+async def get_college_directory(
+    college_id: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    user = Depends(get_current_user)
+):
+    """Full student roster of a college as a cacheable, precompressed snapshot"""
+    college_id = college_id or user.get("college_id")
+    if not college_id:
+        raise HTTPException(status_code=400, detail="college_id is required")
+    require_college_access(user, college_id)
+    
+    snapshot = await directory.get_snapshot(db, college_id)
+    headers = {"ETag": snapshot.etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if if_none_match == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    if directory.accepts_gzip(accept_encoding):
+        headers["Content-Encoding"] = "gzip"
+        return Response(snapshot.gzipped, media_type="application/json", headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
 
 @api_router.post("/testimonials")
 async def create_testimonial(testimonial: TestimonialCreate, user = Depends(get_current_user)):
@@ -553,19 +908,16 @@ async def create_testimonial(testimonial: TestimonialCreate, user = Depends(get_
     
     # Verify the target student exists and is from the same college
     target_student = await db.users.find_one(
-        {"id": testimonial.to_student_id, "user_type": "student"}
+        tenants.scoped(user["college_id"], {"id": testimonial.to_student_id, "user_type": "student"})
     )
     if not target_student:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
-    if target_student.get("college_id") != user.get("college_id"):
-        raise HTTPException(status_code=403, detail="Can only write testimonials for students in your college")
+        raise HTTPException(status_code=404, detail="Student not found in your college")
     
     # Check if already wrote a testimonial for this student
-    existing = await db.testimonials.find_one({
+    existing = await db.testimonials.find_one(tenants.scoped(user["college_id"], {
         "from_student_id": user["id"],
         "to_student_id": testimonial.to_student_id
-    })
+    }))
     
     if existing:
         # Update existing testimonial
@@ -579,9 +931,11 @@ async def create_testimonial(testimonial: TestimonialCreate, user = Depends(get_
         return {"success": True, "message": "Testimonial updated", "word_count": word_count}
     else:
         # Create new testimonial
+        await tenants.consume(db, user["college_id"], "testimonials", 1, "daily_testimonials")
         testimonial_doc = {
+            "college_id": user["college_id"],
             "from_student_id": user["id"],
-            "from_student_name": user.get("name", ""),
+            "from_student_name": user.get("name") or (user.get("profile") or {}).get("full_name", ""),
             "to_student_id": testimonial.to_student_id,
             "text": testimonial.text,
             "word_count": word_count,
@@ -598,10 +952,11 @@ async def get_received_testimonials(user = Depends(get_current_user)):
     if user["user_type"] != "student":
         raise HTTPException(status_code=403, detail="Only students can view testimonials")
     
+    limits = await tenants.get_limits(db, user["college_id"])
     testimonials = await db.testimonials.find(
-        {"to_student_id": user["id"]},
+        tenants.scoped(user["college_id"], {"to_student_id": user["id"]}),
         {"_id": 0}
-    ).to_list(1000)
+    ).to_list(limits["max_list_size"])
     
     return testimonials
 
@@ -611,23 +966,85 @@ async def get_written_testimonials(user = Depends(get_current_user)):
     if user["user_type"] != "student":
         raise HTTPException(status_code=403, detail="Only students can view testimonials")
     
+    limits = await tenants.get_limits(db, user["college_id"])
     testimonials = await db.testimonials.find(
-        {"from_student_id": user["id"]},
+        tenants.scoped(user["college_id"], {"from_student_id": user["id"]}),
         {"_id": 0}
-    ).to_list(1000)
+    ).to_list(limits["max_list_size"])
     
     return testimonials
 
+@api_router.get("/testimonials/received/enriched")
+async def get_received_testimonials_enriched(
+    page: int = Query(1, ge=1), page_size: int = Query(20, ge=1, le=100), user = Depends(get_current_user)
+):
+    """Testimonials written for the current student, with each author's display info"""
+    if user["user_type"] != "student":
+        raise HTTPException(status_code=403, detail="Only students can view testimonials")
+    
+    pipeline = testimonial_queries.enriched_testimonials(
+        user["college_id"], {"to_student_id": user["id"]}, "from_student_id", "author", page, page_size
+    )
+    facet = await db.testimonials.aggregate(pipeline).to_list(1)
+    return testimonial_queries.page_result(facet, page, page_size)
+
+@api_router.get("/testimonials/written/enriched")
+async def get_written_testimonials_enriched(
+    page: int = Query(1, ge=1), page_size: int = Query(20, ge=1, le=100), user = Depends(get_current_user)
+):
+    """Testimonials written by the current student, with each recipient's display info"""
+    if user["user_type"] != "student":
+        raise HTTPException(status_code=403, detail="Only students can view testimonials")
+    
+    pipeline = testimonial_queries.enriched_testimonials(
+        user["college_id"], {"from_student_id": user["id"]}, "to_student_id", "recipient", page, page_size
+    )
+    facet = await db.testimonials.aggregate(pipeline).to_list(1)
+    return testimonial_queries.page_result(facet, page, page_size)
+
+def require_college_access(user: Dict[str, Any], college_id: str):
+    if user["user_type"] == "admin":
+        return
+    if user.get("college_id") != college_id:
+        raise HTTPException(status_code=403, detail="Can only view your own college")
+
+@api_router.get("/colleges/{college_id}/testimonials/unreceived")
+async def get_students_without_testimonials(
+    college_id: str, page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=200), user = Depends(get_current_user)
+):
+    """Students of a college who have not received any testimonial yet"""
+    require_college_access(user, college_id)
+    
+    pipeline = testimonial_queries.students_without_testimonials(college_id, page, page_size)
+    facet = await analytics_db.users.aggregate(pipeline).to_list(1)
+    return testimonial_queries.page_result(facet, page, page_size)
+
+@api_router.get("/colleges/{college_id}/testimonials/mutual")
+async def get_mutual_testimonials(
+    college_id: str, page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=200), user = Depends(get_current_user)
+):
+    """Pairs of students in a college who wrote testimonials for each other"""
+    require_college_access(user, college_id)
+    
+    pipeline = testimonial_queries.mutual_testimonial_pairs(college_id, page, page_size)
+    facet = await analytics_db.users.aggregate(pipeline).to_list(1)
+    return testimonial_queries.page_result(facet, page, page_size)
+
 @api_router.get("/students/{student_id}/testimonials")
 async def get_student_testimonials(student_id: str, user = Depends(get_current_user)):
     """Get testimonials for a specific student (admin only)"""
     if user["user_type"] != "admin":
         raise HTTPException(status_code=403, detail="Only admins can view student testimonials")
     
-    testimonials = await db.testimonials.find(
-        {"to_student_id": student_id},
+    student = await db.users.find_one({"id": student_id, "user_type": "student"}, {"_id": 0, "college_id": 1})
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    
+    limits = await tenants.get_limits(db, student["college_id"])
+    testimonials = await analytics_db.testimonials.find(
+        tenants.scoped(student["college_id"], {"to_student_id": student_id}),
         {"_id": 0}
-    ).to_list(1000)
+    ).to_list(limits["max_list_size"])
     
     return testimonials
 
@@ -680,38 +1097,21 @@ async def update_testimonial(from_student_id: str, to_student_id: str, update_da
     
     return {"success": True, "message": "Testimonial updated"}
 
+def load_drive():
+    """Import the Drive integration on first use; it pulls in the Google API client"""
+    import drive
+    return drive
+
 @api_router.get("/drive/connect")
 async def connect_drive(user = Depends(get_current_user)):
     try:
-        redirect_uri = os.getenv("GOOGLE_DRIVE_REDIRECT_URI", f"{os.getenv('CORS_ORIGINS', '*').split(',')[0]}/api/drive/callback")
-        
         client_id = os.getenv("GOOGLE_CLIENT_ID")
         client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
         
         if not client_id or not client_secret:
             return {"error": "Google Drive not configured. Please set up Google OAuth credentials."}
         
-        flow = Flow.from_client_config(
-            {
-                "web": {
-                    "client_id": client_id,
-                    "client_secret": client_secret,
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                    "redirect_uris": [redirect_uri]
-                }
-            },
-            scopes=['https://www.googleapis.com/auth/drive.file'],
-            redirect_uri=redirect_uri
-        )
-        
-        authorization_url, state = flow.authorization_url(
-            access_type='offline',
-            include_granted_scopes='true',
-            prompt='consent',
-            state=user["id"]
-        )
-        
+        authorization_url = load_drive().authorization_url(user["id"], client_id, client_secret)
         return {"authorization_url": authorization_url}
     except Exception as e:
         logger.error(f"Drive connect failed: {str(e)}")
@@ -720,40 +1120,7 @@ async def connect_drive(user = Depends(get_current_user)):
 @api_router.get("/drive/callback")
 async def drive_callback(code: str = Query(...), state: str = Query(...)):
     try:
-        redirect_uri = os.getenv("GOOGLE_DRIVE_REDIRECT_URI", f"{os.getenv('CORS_ORIGINS', '*').split(',')[0]}/api/drive/callback")
-        
-        flow = Flow.from_client_config(
-            {
-                "web": {
-                    "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-                    "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                    "redirect_uris": [redirect_uri]
-                }
-            },
-            scopes=None,
-            redirect_uri=redirect_uri
-        )
-        
-        flow.fetch_token(code=code)
-        credentials = flow.credentials
-        
-        await db.drive_credentials.update_one(
-            {"user_id": state},
-            {"$set": {
-                "user_id": state,
-                "access_token": credentials.token,
-                "refresh_token": credentials.refresh_token,
-                "token_uri": credentials.token_uri,
-                "client_id": credentials.client_id,
-                "client_secret": credentials.client_secret,
-                "scopes": credentials.scopes,
-                "expiry": credentials.expiry.isoformat() if credentials.expiry else None,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }},
-            upsert=True
-        )
+        await load_drive().store_credentials(db, code, state)
         
         frontend_url = os.getenv("CORS_ORIGINS", "*").split(",")[0]
         return {"message": "Drive connected", "redirect": f"{frontend_url}/dashboard?drive_connected=true"}
@@ -761,32 +1128,102 @@ async def drive_callback(code: str = Query(...), state: str = Query(...)):
         logger.error(f"Drive callback failed: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-async def get_drive_service(user_id: str):
-    creds_doc = await db.drive_credentials.find_one({"user_id": user_id})
-    if not creds_doc:
-        return None
-    
-    creds = Credentials(
-        token=creds_doc["access_token"],
-        refresh_token=creds_doc.get("refresh_token"),
-        token_uri=creds_doc["token_uri"],
-        client_id=creds_doc["client_id"],
-        client_secret=creds_doc["client_secret"],
-        scopes=creds_doc["scopes"]
-    )
+async def set_photo_slots(user: Dict[str, Any], new_photos: List[Dict[str, Any]]) -> int:
+    """
+    Put photos in their slots, replacing previous ones, in a single user write; returns the new completion.
+
+    The write is guarded on photos_rev, which every change to the photos array
+    increments, so concurrent uploads to other slots are re-read and kept
+    rather than overwritten. If the photos never land in their slots, the
+    stored-photo references taken for them are released.
+    """
+    slots = {p["slot_index"] for p in new_photos}
+    key = tenants.scoped(user["college_id"], {"id": user["id"]})
     
-    if creds.expired and creds.refresh_token:
-        creds.refresh(GoogleRequest())
-        await db.drive_credentials.update_one(
-            {"user_id": user_id},
-            {"$set": {
-                "access_token": creds.token,
-                "expiry": creds.expiry.isoformat() if creds.expiry else None,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+    try:
+        college = await db.colleges.find_one({"id": user["college_id"]}, {"_id": 0})
+        for _ in range(PHOTO_WRITE_RETRIES):
+            current = await db.users.find_one(key, {"_id": 0, "hashed_password": 0})
+            if not current:
+                raise HTTPException(status_code=404, detail="User not found")
+            photos = current.get("photos", [])
+            replaced = [p for p in photos if p.get("slot_index") in slots]
+            photos = [p for p in photos if p.get("slot_index") not in slots] + new_photos
+            completion = calculate_profile_completion({**current, "photos": photos}, college)
+            
+            result = await db.users.update_one(
+                {**key, "photos_rev": current.get("photos_rev")},
+                {"$set": {"photos": photos, "profile_completion": completion}, "$inc": {"photos_rev": 1}}
+            )
+            if result.modified_count:
+                break
+        else:
+            raise HTTPException(status_code=409, detail="Photos were changed concurrently, please retry")
+    except BaseException:
+        await uploads.release_photos(db, new_photos)
+        raise
+    
+    await directory.upsert_students(db, [{**current, "photos": photos}])
+    await uploads.release_photos(db, replaced)
+    
+    return completion
+
+async def set_photo_slot(user: Dict[str, Any], photo: Dict[str, Any]) -> int:
+    return await set_photo_slots(user, [photo])
+
+def gridfs_photo(slot_index: int, filename: str, stored: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "slot_index": slot_index,
+        "file_id": stored["file_id"],
+        "file_url": uploads.photo_path(stored["file_id"]),
+        "filename": filename,
+        "storage": "gridfs",
+        "content_type": stored["content_type"],
+        "size": stored["size"],
+        "sha256": stored["sha256"],
+        "uploaded_at": datetime.now(timezone.utc).isoformat()
+    }
+
+async def store_photo(user: Dict[str, Any], file: UploadFile, slot_index: int,
+                      creds_doc: Optional[Dict[str, Any]]):
+    """Store one uploaded photo in Drive or GridFS; returns (photo entry, deduplicated)"""
+    uploads.check_declared(file.content_type, file.size)
+    
+    # The body is already spooled, so hashing it first lets repeat uploads skip storage entirely
+    hashed = await uploads.hash_upload_file(file)
+    await tenants.consume(db, user["college_id"], "upload_bytes", hashed["size"], "daily_upload_bytes")
+    
+    # Try Google Drive first; only load the Drive client for users who connected it
+    if creds_doc:
+        same = [p for p in user.get("photos", []) if p.get("storage") == "drive" and p.get("sha256") == hashed["sha256"]]
+        if same:
+            photo = {**same[0], "slot_index": slot_index, "filename": file.filename,
+                     "uploaded_at": datetime.now(timezone.utc).isoformat()}
+            return photo, True
+        
+        drive = load_drive()
+        drive_service = await drive.get_drive_service(db, user["id"], creds_doc)
+        try:
+            file_id, file_url = await asyncio.to_thread(
+                drive.upload_file, drive_service, f"{user['id']}_slot_{slot_index}_{file.filename}", file.file, file.content_type
+            )
+            photo = {
+                "slot_index": slot_index,
+                "file_id": file_id,
+                "file_url": file_url,
+                "filename": file.filename,
+                "storage": "drive",
+                "sha256": hashed["sha256"],
+                "uploaded_at": datetime.now(timezone.utc).isoformat()
+            }
+            return photo, False
+        except Exception as e:
+            logger.warning(f"Drive upload failed, using MongoDB: {str(e)}")
+            await file.seek(0)
     
-    return build('drive', 'v3', credentials=creds)
+    # Fallback to MongoDB, streamed into GridFS chunk by chunk
+    stored = await uploads.store_upload_file(db, file, hashed, {"user_id": user["id"], "college_id": user["college_id"], "slot_index": slot_index})
+    return gridfs_photo(slot_index, file.filename, stored), stored["deduplicated"]
 
 @api_router.post("/photos/upload")
 async def upload_photo(file: UploadFile = File(...), slot_index: int = Query(...), user = Depends(get_current_user)):
@@ -794,60 +1231,174 @@ async def upload_photo(file: UploadFile = File(...), slot_index: int = Query(...
         raise HTTPException(status_code=403, detail="Only students can upload photos")
     
     try:
-        # For MVP, store in MongoDB as base64 (Google Drive is optional)
-        contents = await file.read()
-        
-        # Try Google Drive first
-        drive_service = await get_drive_service(user["id"])
-        file_url = None
-        file_id = None
+        creds_doc = await db.drive_credentials.find_one({"user_id": user["id"]})
+        photo, deduplicated = await store_photo(user, file, slot_index, creds_doc)
         
-        if drive_service:
-            try:
-                file_metadata = {'name': f"{user['id']}_slot_{slot_index}_{file.filename}"}
-                media = MediaIoBaseUpload(io.BytesIO(contents), mimetype=file.content_type, resumable=True)
-                uploaded_file = drive_service.files().create(body=file_metadata, media_body=media, fields='id,webViewLink').execute()
-                file_id = uploaded_file.get('id')
-                file_url = uploaded_file.get('webViewLink')
-            except Exception as e:
-                logger.warning(f"Drive upload failed, using MongoDB: {str(e)}")
-        
-        # Fallback to MongoDB
-        if not file_url:
-            import base64
-            file_url = f"data:{file.content_type};base64,{base64.b64encode(contents).decode()}"
-            file_id = secrets.token_urlsafe(16)
-        
-        # Update user's photos
-        photos = user.get("photos", [])
-        photos = [p for p in photos if p.get("slot_index") != slot_index]
-        photos.append({
-            "slot_index": slot_index,
-            "file_id": file_id,
-            "file_url": file_url,
-            "filename": file.filename,
-            "uploaded_at": datetime.now(timezone.utc).isoformat()
-        })
-        
-        await db.users.update_one(
-            {"id": user["id"]},
-            {"$set": {"photos": photos}}
-        )
-        
-        updated_user = await db.users.find_one({"id": user["id"]}, {"_id": 0})
-        college = await db.colleges.find_one({"id": user["college_id"]}, {"_id": 0})
-        completion = calculate_profile_completion(updated_user, college)
-        
-        await db.users.update_one(
-            {"id": user["id"]},
-            {"$set": {"profile_completion": completion}}
-        )
-        
-        return {"success": True, "file_url": file_url, "profile_completion": completion}
+        completion = await set_photo_slot(user, photo)
+        return {"success": True, "file_url": photo["file_url"], "profile_completion": completion, "deduplicated": deduplicated}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Photo upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/photos/upload-batch")
+async def upload_photos_batch(
+    files: List[UploadFile] = File(...),
+    slot_indexes: List[int] = Form(...),
+    user = Depends(get_current_user)
+):
+    """Upload several photos in one request; all slot changes land in a single user write"""
+    if user["user_type"] != "student":
+        raise HTTPException(status_code=403, detail="Only students can upload photos")
+    
+    if len(files) != len(slot_indexes):
+        raise HTTPException(status_code=400, detail="Send one slot index per file")
+    if len(files) > MAX_BATCH_PHOTOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PHOTOS} photos per batch")
+    if len(set(slot_indexes)) != len(slot_indexes):
+        raise HTTPException(status_code=400, detail="Each slot can only appear once per batch")
+    
+    creds_doc = await db.drive_credentials.find_one({"user_id": user["id"]})
+    semaphore = asyncio.Semaphore(PHOTO_BATCH_PARALLELISM)
+    
+    async def process(file: UploadFile, slot_index: int):
+        async with semaphore:
+            try:
+                photo, deduplicated = await store_photo(user, file, slot_index, creds_doc)
+                return {"slot_index": slot_index, "success": True, "photo": photo, "deduplicated": deduplicated}
+            except HTTPException as e:
+                return {"slot_index": slot_index, "success": False, "status_code": e.status_code, "detail": e.detail}
+            except Exception as e:
+                logger.error(f"Photo upload failed for slot {slot_index}: {str(e)}")
+                return {"slot_index": slot_index, "success": False, "status_code": 500, "detail": str(e)}
+    
+    results = await asyncio.gather(*(process(f, i) for f, i in zip(files, slot_indexes)))
+    stored = [r["photo"] for r in results if r["success"]]
+    if not stored:
+        raise HTTPException(status_code=400, detail={"message": "No photos were uploaded", "results": results})
+    
+    completion = await set_photo_slots(user, stored)
+    
+    for r in results:
+        if r["success"]:
+            r["file_url"] = r.pop("photo")["file_url"]
+    
+    return {"success": len(stored) == len(results), "profile_completion": completion, "results": results}
+
+@api_router.post("/photos/upload-sessions")
+async def create_upload_session(session_data: PhotoUploadSessionCreate, user = Depends(get_current_user)):
+    """Start a resumable photo upload; chunks are then PUT at increasing offsets"""
+    if user["user_type"] != "student":
+        raise HTTPException(status_code=403, detail="Only students can upload photos")
+    
+    if session_data.sha256:
+        uploads.check_declared(session_data.content_type, session_data.size)
+        # A declared hash only stands in for the bytes of a photo already used in the
+        # caller's college, so it can't claim or probe for other colleges' photos
+        sha256 = session_data.sha256.lower()
+        in_college = await db.users.find_one(
+            tenants.scoped(user["college_id"], {"photos": {"$elemMatch": {"sha256": sha256, "storage": "gridfs"}}}),
+            {"_id": 1}
+        )
+        existing = await uploads.acquire_existing(db, sha256) if in_college else None
+        if existing:
+            photo = gridfs_photo(session_data.slot_index, session_data.filename, existing)
+            completion = await set_photo_slot(user, photo)
+            return {"success": True, "deduplicated": True, "file_url": photo["file_url"], "profile_completion": completion}
+    
+    await tenants.consume(db, user["college_id"], "upload_bytes", session_data.size, "daily_upload_bytes")
+    session = await uploads.create_session(
+        db, user["id"], session_data.slot_index, session_data.filename, session_data.content_type, session_data.size
+    )
+    return {
+        "session_id": session["id"],
+        "size": session["size"],
+        "received": 0,
+        "chunk_size": uploads.CHUNK_SIZE,
+        "max_chunk_bytes": uploads.MAX_SESSION_CHUNK_BYTES
+    }
+
+@api_router.get("/photos/upload-sessions/{session_id}")
+async def get_upload_session(session_id: str, user = Depends(get_current_user)):
+    """How many bytes of a resumable upload the server has; resume from there"""
+    session = await uploads.get_session(db, session_id, user["id"])
+    return {"session_id": session_id, "size": session["size"], "received": session["received"]}
+
+@api_router.put("/photos/upload-sessions/{session_id}")
+async def upload_session_chunk(session_id: str, request: Request, offset: int = Query(..., ge=0), user = Depends(get_current_user)):
+    """Append the raw request body to a resumable upload at `offset`"""
+    session = await uploads.get_session(db, session_id, user["id"])
+    received = await uploads.append_chunk(db, session, offset, request.stream())
+    return {"session_id": session_id, "size": session["size"], "received": received}
+
+@api_router.post("/photos/upload-sessions/{session_id}/complete")
+async def complete_upload_session(session_id: str, user = Depends(get_current_user)):
+    """Assemble a fully received upload and put it in its photo slot"""
+    session = await uploads.get_session(db, session_id, user["id"])
+    stored = await uploads.complete_session(db, session, {"user_id": user["id"], "slot_index": session["slot_index"]})
+    
+    photo = gridfs_photo(session["slot_index"], session["filename"], stored)
+    completion = await set_photo_slot(user, photo)
+    return {"success": True, "file_url": photo["file_url"], "profile_completion": completion, "deduplicated": stored["deduplicated"]}
+
+@api_router.delete("/photos/upload-sessions/{session_id}")
+async def cancel_upload_session(session_id: str, user = Depends(get_current_user)):
+    await uploads.get_session(db, session_id, user["id"])
+    await uploads.discard_session(db, session_id)
+    return {"success": True}
+
+@api_router.get("/photos/files/{file_id}", name="get_photo_file")
+async def get_photo_file(file_id: str):
+    """Stream a stored photo; ids are random tokens, so this works as an <img> src without auth"""
+    grid_out = await uploads.open_photo(db, file_id)
+    if not grid_out:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    
+    headers = {"Cache-Control": "private, max-age=31536000, immutable", "Content-Length": str(grid_out.length)}
+    return StreamingResponse(
+        uploads.iter_photo(grid_out),
+        media_type=grid_out.content_type or "application/octet-stream",
+        headers=headers
+    )
+
+@api_router.get("/profiles")
+async def list_profiles(limit: int = Query(50, ge=1, le=500), user = Depends(get_current_user)):
+    """List recent request profiles (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view profiles")
+    
+    return profile_store.list(limit)
+
+@api_router.get("/profiles/{profile_id}")
+async def get_profile_file(profile_id: str, format: str = Query("collapsed"), user = Depends(get_current_user)):
+    """Download a profile as collapsed stacks (flamegraph) or raw pstats (admin only)"""
+    if user["user_type"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view profiles")
+    
+    # Collapsed stacks are built on first download; keep that off the event loop
+    path = await asyncio.to_thread(profile_store.path_for, profile_id, format)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    media_type = "text/plain" if format == "collapsed" else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=path.name)
+
+async def is_admin_request(authorization: Optional[str]) -> bool:
+    try:
+        user = await get_current_user(authorization)
+    except HTTPException:
+        return False
+    return user["user_type"] == "admin"
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics(authorization: str = Header(None)):
+    """Prometheus scrape endpoint; guarded by METRICS_TOKEN when it is set"""
+    token = os.getenv("METRICS_TOKEN")
+    if token and authorization != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(api_router)
 
 app.add_middleware(
@@ -856,8 +1407,34 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Query-Trace"],
 )
 
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    # Room for the multipart framing around the file
+    limits={
+        "/api/photos/upload": uploads.MAX_PHOTO_BYTES + 64 * 1024,
+        "/api/photos/upload-batch": MAX_BATCH_PHOTOS * (uploads.MAX_PHOTO_BYTES + 64 * 1024),
+    },
+)
+app.add_middleware(
+    ProfilingMiddleware,
+    store=profile_store,
+    authorize=is_admin_request,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+)
+app.add_middleware(QueryTraceMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def create_indexes():
+    await uploads.ensure_indexes(db)
+    await testimonial_queries.ensure_indexes(db)
+    await directory.ensure_indexes(db)
+    await tenants.ensure_indexes(db)
+    await tenants.backfill_testimonial_colleges(db)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
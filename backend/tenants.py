@@ -0,0 +1,144 @@
+"""
+Per-college tenant scoping, quotas and limits.
+
+Every college is a tenant. Tenant-owned documents (users, testimonials,
+college_directory, uploaded photo metadata) carry college_id. Student and
+testimonial queries lead with it through scoped(), backed by indexes that
+start with college_id; the exceptions are lookups by globally unique keys
+(user id from a token, email at login, an admin's selection by student id),
+which use their own indexes. That keeps one large college's working set and
+index ranges apart from the others, and the layout ready to shard on:
+
+    users              {college_id: 1, id: 1}
+    testimonials       {college_id: 1, to_student_id: 1}
+    college_directory  {college_id: 1, id: 1}
+
+Nothing here needs a sharded cluster; a standalone mongod works the same.
+
+Limits come from TENANT_* environment variables and can be overridden per
+college in its `limits` field. Daily counters (upload bytes, testimonials)
+live in tenant_usage, one document per college and UTC day, and expire on
+their own. A limit of 0 means unlimited; usage is counted either way.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+LIMIT_ENV = {
+    "max_students": ("TENANT_MAX_STUDENTS", 0),
+    "max_list_size": ("TENANT_MAX_LIST_SIZE", 1000),
+    "daily_upload_bytes": ("TENANT_DAILY_UPLOAD_BYTES", 0),
+    "daily_testimonials": ("TENANT_DAILY_TESTIMONIALS", 0),
+}
+# Daily counters kept in tenant_usage
+COUNTERS = ("upload_bytes", "testimonials")
+LIMITS_CACHE_SECONDS = 30
+USAGE_RETENTION = timedelta(days=7)
+
+_limits_cache: Dict[str, Tuple[float, Dict[str, int]]] = {}
+
+
+def default_limits() -> Dict[str, int]:
+    return {name: int(os.getenv(env, str(default))) for name, (env, default) in LIMIT_ENV.items()}
+
+
+def scoped(college_id: str, query: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """A query on tenant-owned documents, led by the tenant key"""
+    return {"college_id": college_id, **(query or {})}
+
+
+def by_college(students: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Student ids grouped by college, for scoped multi-student writes"""
+    groups: Dict[str, List[str]] = {}
+    for student in students:
+        groups.setdefault(student.get("college_id"), []).append(student["id"])
+    return groups
+
+
+async def get_limits(db, college_id: Optional[str]) -> Dict[str, int]:
+    """The college's limits: its own overrides over the environment defaults, cached briefly"""
+    if not college_id:
+        return default_limits()
+    cached = _limits_cache.get(college_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    college = await db.colleges.find_one({"id": college_id}, {"_id": 0, "limits": 1})
+    limits = {**default_limits(), **((college or {}).get("limits") or {})}
+    _limits_cache[college_id] = (time.monotonic() + LIMITS_CACHE_SECONDS, limits)
+    return limits
+
+
+def invalidate(college_id: str):
+    _limits_cache.pop(college_id, None)
+
+
+async def check_student_quota(db, college_id: str, adding: int):
+    limit = (await get_limits(db, college_id))["max_students"]
+    if not limit:
+        return
+    count = await db.users.count_documents(scoped(college_id, {"user_type": "student"}))
+    if count + adding > limit:
+        raise HTTPException(
+            status_code=429,
+            detail=f"College student limit reached ({count} of {limit}); cannot add {adding} more"
+        )
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+async def consume(db, college_id: str, counter: str, amount: int, limit_name: str):
+    """Add `amount` to today's `counter` for the college, or raise 429 if that would pass its limit"""
+    day = _today()
+    key = {"_id": f"{college_id}:{day}"}
+    try:
+        await db.tenant_usage.update_one(key, {"$setOnInsert": {
+            "college_id": college_id,
+            "day": day,
+            "expires_at": datetime.now(timezone.utc) + USAGE_RETENTION,
+            **{name: 0 for name in COUNTERS}
+        }}, upsert=True)
+    except DuplicateKeyError:
+        pass  # created concurrently
+
+    limit = (await get_limits(db, college_id))[limit_name]
+    query = dict(key)
+    if limit:
+        query[counter] = {"$lte": limit - amount}
+    result = await db.tenant_usage.update_one(query, {"$inc": {counter: amount}})
+    if result.modified_count == 0:
+        raise HTTPException(status_code=429, detail=f"College daily {counter.replace('_', ' ')} limit ({limit}) reached")
+
+
+async def usage(db, college_id: str) -> Dict[str, Any]:
+    today = await db.tenant_usage.find_one({"_id": f"{college_id}:{_today()}"}, {"_id": 0, "expires_at": 0})
+    return {
+        "college_id": college_id,
+        "students": await db.users.count_documents(scoped(college_id, {"user_type": "student"})),
+        "today": today or {"college_id": college_id, "day": _today()},
+        "limits": await get_limits(db, college_id),
+    }
+
+
+async def backfill_testimonial_colleges(db):
+    """Give testimonials written before they carried college_id their recipient's college"""
+    if not await db.testimonials.find_one({"college_id": {"$exists": False}}, {"_id": 1}):
+        return
+    await db.testimonials.aggregate([
+        {"$match": {"college_id": {"$exists": False}}},
+        {"$lookup": {"from": "users", "localField": "to_student_id", "foreignField": "id", "as": "recipient"}},
+        {"$project": {"college_id": {"$first": "$recipient.college_id"}}},
+        {"$match": {"college_id": {"$ne": None}}},
+        {"$merge": {"into": "testimonials", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ]).to_list(None)
+
+
+async def ensure_indexes(db):
+    await db.users.create_index([("college_id", 1), ("id", 1)])
+    await db.tenant_usage.create_index("expires_at", expireAfterSeconds=0)
@@ -0,0 +1,148 @@
+"""
+Aggregation pipelines for testimonial listings and college testimonial graphs.
+
+Testimonials are joined with their author/recipient's display fields and a
+thumbnail URL so clients no longer need the full college roster to render
+them. Every pipeline is paginated with $facet (one round trip returns the
+page and the total). Matches and joins are scoped to one college and rely
+on the indexes created by ensure_indexes here and in tenants.py.
+"""
+
+from typing import Any, Dict, List
+
+# Display fields for a student joined onto a testimonial
+STUDENT_CARD = {
+    "_id": 0,
+    "id": 1,
+    # Same rule as directory.directory_entry: the account name, else the profile's full name
+    "name": {"$cond": [{"$gt": [{"$ifNull": ["$name", ""]}, ""]}, "$name", {"$ifNull": ["$profile.full_name", ""]}]},
+    "nickname": "$profile.nickname",
+    # First photo stored outside the user document; legacy data URLs are too big to inline
+    "thumbnail": {
+        "$let": {
+            "vars": {
+                "stored": {
+                    "$filter": {
+                        "input": {"$ifNull": ["$photos", []]},
+                        "cond": {"$ne": [{"$ifNull": ["$$this.storage", None]}, None]}
+                    }
+                }
+            },
+            "in": {"$arrayElemAt": ["$$stored.file_url", 0]}
+        }
+    }
+}
+
+
+def _paginate(page: int, page_size: int, stages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """$facet returning {"items": [...], "total": [{"count": n}]}; `stages` run on the page only"""
+    return [{
+        "$facet": {
+            "items": [{"$skip": (page - 1) * page_size}, {"$limit": page_size}, *stages],
+            "total": [{"$count": "count"}]
+        }
+    }]
+
+
+def _join_student(college_id: str, local_field: str, as_field: str) -> List[Dict[str, Any]]:
+    return [
+        {"$lookup": {
+            "from": "users",
+            "let": {"student_id": f"${local_field}"},
+            "pipeline": [
+                {"$match": {"college_id": college_id, "$expr": {"$eq": ["$id", "$$student_id"]}}},
+                {"$limit": 1},
+                {"$project": STUDENT_CARD}
+            ],
+            "as": as_field
+        }},
+        {"$set": {as_field: {"$arrayElemAt": [f"${as_field}", 0]}}}
+    ]
+
+
+def enriched_testimonials(college_id: str, match: Dict[str, Any], join_field: str, as_field: str,
+                          page: int, page_size: int):
+    """A college's testimonials matching `match`, newest first, each with the student in `join_field` joined as `as_field`"""
+    return [
+        {"$match": {"college_id": college_id, **match}},
+        {"$sort": {"created_at": -1}},
+        *_paginate(page, page_size, [
+            *_join_student(college_id, join_field, as_field),
+            {"$project": {"_id": 0}}
+        ])
+    ]
+
+
+def students_without_testimonials(college_id: str, page: int, page_size: int):
+    """Students of a college nobody has written a testimonial for yet"""
+    return [
+        {"$match": {"college_id": college_id, "user_type": "student"}},
+        {"$lookup": {
+            "from": "testimonials",
+            "let": {"student_id": "$id"},
+            "pipeline": [
+                {"$match": {"college_id": college_id, "$expr": {"$eq": ["$to_student_id", "$$student_id"]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 1}}
+            ],
+            "as": "received"
+        }},
+        {"$match": {"received": {"$size": 0}}},
+        {"$sort": {"id": 1}},
+        *_paginate(page, page_size, [{"$project": STUDENT_CARD}])
+    ]
+
+
+def mutual_testimonial_pairs(college_id: str, page: int, page_size: int):
+    """Pairs of students in a college who wrote testimonials for each other, each pair once"""
+    return [
+        {"$match": {"college_id": college_id, "user_type": "student"}},
+        {"$project": {"_id": 0, "id": 1}},
+        {"$lookup": {
+            "from": "testimonials",
+            "let": {"student_id": "$id"},
+            "pipeline": [
+                {"$match": {"college_id": college_id, "$expr": {"$eq": ["$from_student_id", "$$student_id"]}}},
+                {"$project": {"_id": 0, "to_student_id": 1}}
+            ],
+            "as": "written"
+        }},
+        {"$unwind": "$written"},
+        {"$project": {"a": "$id", "b": "$written.to_student_id"}},
+        # Each mutual pair shows up from both sides; keep the ordered one
+        {"$match": {"$expr": {"$lt": ["$a", "$b"]}}},
+        {"$lookup": {
+            "from": "testimonials",
+            "let": {"a": "$a", "b": "$b"},
+            "pipeline": [
+                {"$match": {"college_id": college_id, "$expr": {"$and": [
+                    {"$eq": ["$from_student_id", "$$b"]},
+                    {"$eq": ["$to_student_id", "$$a"]}
+                ]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 1}}
+            ],
+            "as": "reply"
+        }},
+        {"$match": {"reply": {"$ne": []}}},
+        {"$sort": {"a": 1, "b": 1}},
+        *_paginate(page, page_size, [
+            *_join_student(college_id, "a", "student_a"),
+            *_join_student(college_id, "b", "student_b"),
+            {"$project": {"_id": 0, "student_a": 1, "student_b": 1}}
+        ])
+    ]
+
+
+def page_result(facet: List[Dict[str, Any]], page: int, page_size: int) -> Dict[str, Any]:
+    result = facet[0] if facet else {"items": [], "total": []}
+    total = result["total"][0]["count"] if result["total"] else 0
+    return {"items": result["items"], "total": total, "page": page, "page_size": page_size}
+
+
+async def ensure_indexes(db):
+    await db.users.create_index("id")
+    await db.users.create_index([("college_id", 1), ("user_type", 1), ("id", 1)])
+    await db.testimonials.create_index([("from_student_id", 1), ("to_student_id", 1)])
+    await db.testimonials.create_index([("college_id", 1), ("to_student_id", 1), ("created_at", -1)])
+    await db.testimonials.create_index([("college_id", 1), ("from_student_id", 1), ("created_at", -1)])
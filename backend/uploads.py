@@ -0,0 +1,407 @@
+"""
+Streaming photo storage.
+
+Photos are written to a GridFS bucket chunk by chunk as the request body
+arrives, so memory per concurrent upload is bounded by the chunk size rather
+than the file size. A SHA-256 of the content is computed while streaming.
+Size and content type are enforced as soon as the bytes that violate them
+arrive: the declared Content-Length is checked before the body is read, and
+the image type is sniffed from the first chunk.
+
+Photos are content addressed: an upload whose SHA-256 matches a stored
+photo only takes a reference on it, and stored files are reference counted
+and deleted when no photo slot uses them any more.
+
+Resumable sessions let flaky clients upload a photo in pieces: each chunk is
+stored as it arrives, and completing the session streams the chunks, in
+order, into GridFS.
+
+Stored files are keyed by a random token rather than an ObjectId, which
+embeds a timestamp and a counter: photo URLs are served without auth (they
+are used as <img> sources), so one URL must not lead to the others.
+"""
+
+import hashlib
+import os
+import secrets
+from datetime import datetime, timezone, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
+
+MAX_PHOTO_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(10 * 1024 * 1024)))
+CHUNK_SIZE = 256 * 1024
+MAX_SESSION_CHUNK_BYTES = 4 * 1024 * 1024
+SESSION_TTL = timedelta(hours=24)
+PHOTO_BUCKET = "photos"
+
+# Leading bytes of the image formats we accept
+IMAGE_SIGNATURES = {
+    "image/jpeg": [b"\xff\xd8\xff"],
+    "image/png": [b"\x89PNG\r\n\x1a\n"],
+    "image/gif": [b"GIF87a", b"GIF89a"],
+    "image/webp": [b"RIFF"],
+}
+
+
+def photo_bucket(db) -> AsyncIOMotorGridFSBucket:
+    return AsyncIOMotorGridFSBucket(db, bucket_name=PHOTO_BUCKET, chunk_size_bytes=CHUNK_SIZE)
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    for content_type, signatures in IMAGE_SIGNATURES.items():
+        if any(head.startswith(sig) for sig in signatures):
+            if content_type == "image/webp" and head[8:12] != b"WEBP":
+                continue
+            return content_type
+    return None
+
+
+def check_declared(content_type: Optional[str], size: Optional[int]):
+    """Reject an upload up front from what the client declares"""
+    if content_type and content_type.split(";")[0].strip() not in IMAGE_SIGNATURES:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {content_type}")
+    if size is not None and size > MAX_PHOTO_BYTES:
+        raise HTTPException(status_code=413, detail=f"Photo exceeds {MAX_PHOTO_BYTES} bytes")
+
+
+class UploadCheck:
+    """Running size, type and SHA-256 checks over a stream of chunks"""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.content_type = None
+
+    def feed(self, chunk: bytes):
+        if self.content_type is None:
+            self.content_type = sniff_image_type(chunk[:16])
+            if self.content_type is None:
+                raise HTTPException(status_code=415, detail="File is not a supported image")
+        self.size += len(chunk)
+        if self.size > MAX_PHOTO_BYTES:
+            raise HTTPException(status_code=413, detail=f"Photo exceeds {MAX_PHOTO_BYTES} bytes")
+        self.digest.update(chunk)
+
+    def finish(self) -> str:
+        if self.size == 0:
+            raise HTTPException(status_code=400, detail="Empty file")
+        return self.digest.hexdigest()
+
+
+async def store_stream(db, chunks: AsyncIterator[bytes], filename: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Stream chunks into GridFS, enforcing the size limit and image type as they arrive.
+
+    Returns the stored file's id, detected content type, size and SHA-256.
+    Nothing is left behind in GridFS if the upload is rejected or fails.
+    """
+    check = UploadCheck()
+    grid_in = photo_bucket(db).open_upload_stream_with_id(new_file_id(), filename, metadata=metadata)
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            check.feed(chunk)
+            await grid_in.write(chunk)
+        sha256 = check.finish()
+        await grid_in.set("contentType", check.content_type)
+        await grid_in.set("sha256", sha256)
+        await grid_in.close()
+    except BaseException:
+        await grid_in.abort()
+        raise
+
+    return {"file_id": grid_in._id, "content_type": check.content_type, "size": check.size, "sha256": sha256}
+
+
+async def hash_upload_file(file) -> Dict[str, Any]:
+    """Validate and hash an already spooled UploadFile without storing it, then rewind it"""
+    check = UploadCheck()
+    async for chunk in upload_file_chunks(file):
+        check.feed(chunk)
+    sha256 = check.finish()
+    await file.seek(0)
+    return {"content_type": check.content_type, "size": check.size, "sha256": sha256}
+
+
+async def upload_file_chunks(file, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read a Starlette UploadFile in fixed-size chunks"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def new_file_id() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def photo_path(file_id: str) -> str:
+    """URL path of a stored photo, relative so it survives host and scheme changes"""
+    return f"/api/photos/files/{file_id}"
+
+
+async def open_photo(db, file_id: str):
+    """Open a stored photo for streaming; None if it does not exist"""
+    files = await db[f"{PHOTO_BUCKET}.files"].find_one({"_id": file_id}, {"_id": 1})
+    if not files:
+        return None
+    return await photo_bucket(db).open_download_stream(file_id)
+
+
+async def iter_photo(grid_out) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            return
+        yield chunk
+
+
+async def delete_photo(db, file_id: str):
+    try:
+        await photo_bucket(db).delete(file_id)
+    except Exception:
+        pass
+
+
+# Content-addressed blobs
+#
+# Each distinct photo is stored once. photo_blobs maps its SHA-256 to the
+# GridFS file holding it and counts the photo slots that reference it; the
+# file is deleted when the last reference is released.
+
+def _blob_photo(blob: Dict[str, Any]) -> Dict[str, Any]:
+    return {"file_id": blob["file_id"], "content_type": blob["content_type"], "size": blob["size"],
+            "sha256": blob["_id"], "deduplicated": True}
+
+
+async def acquire_existing(db, sha256: str) -> Optional[Dict[str, Any]]:
+    """Take a reference on an already stored photo with this hash, if there is one"""
+    blob = await db.photo_blobs.find_one_and_update(
+        {"_id": sha256},
+        {"$inc": {"refs": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    return _blob_photo(blob) if blob else None
+
+
+async def register_stored(db, stored: Dict[str, Any], refs: int = 1) -> Dict[str, Any]:
+    """
+    Take `refs` references on a freshly stored file's blob.
+
+    If an identical photo was stored concurrently, the references go to that
+    one and the fresh copy is deleted.
+    """
+    blob = await db.photo_blobs.find_one_and_update(
+        {"_id": stored["sha256"]},
+        {
+            "$inc": {"refs": refs},
+            "$setOnInsert": {
+                "file_id": stored["file_id"],
+                "content_type": stored["content_type"],
+                "size": stored["size"],
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    if blob["file_id"] != stored["file_id"]:
+        await delete_photo(db, stored["file_id"])
+        return _blob_photo(blob)
+    return {**stored, "deduplicated": False}
+
+
+async def store_upload_file(db, file, hashed: Dict[str, Any], metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Store a hashed UploadFile, reusing an identical stored photo when there is one"""
+    existing = await acquire_existing(db, hashed["sha256"])
+    if existing:
+        return existing
+    stored = await store_stream(db, upload_file_chunks(file), file.filename, metadata)
+    return await register_stored(db, stored)
+
+
+async def release_photos(db, photos: List[Dict[str, Any]]):
+    """Drop photo slots' references on their stored files, deleting files with their last reference"""
+    counts: Dict[str, int] = {}
+    for photo in photos:
+        if photo.get("storage") != "gridfs":
+            continue
+        if not photo.get("sha256"):
+            # Stored before deduplication; nothing else can reference it
+            await delete_photo(db, photo["file_id"])
+            continue
+        counts[photo["sha256"]] = counts.get(photo["sha256"], 0) + 1
+
+    for sha256, count in counts.items():
+        blob = await db.photo_blobs.find_one_and_update(
+            {"_id": sha256},
+            {"$inc": {"refs": -count}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob and blob["refs"] <= 0:
+            # Conditional on refs so a concurrent upload that re-acquired the blob keeps it
+            result = await db.photo_blobs.delete_one({"_id": sha256, "refs": {"$lte": 0}})
+            if result.deleted_count:
+                await delete_photo(db, blob["file_id"])
+
+
+async def release_photo(db, photo: Dict[str, Any]):
+    await release_photos(db, [photo])
+
+
+# Resumable sessions
+
+async def create_session(db, user_id: str, slot_index: int, filename: str, content_type: str, size: int) -> Dict[str, Any]:
+    check_declared(content_type, size)
+    now = datetime.now(timezone.utc)
+    session = {
+        "id": os.urandom(12).hex(),
+        "user_id": user_id,
+        "slot_index": slot_index,
+        "filename": filename,
+        "content_type": content_type,
+        "size": size,
+        "received": 0,
+        "chunks": 0,
+        "created_at": now.isoformat(),
+        "expires_at": now + SESSION_TTL
+    }
+    await db.upload_sessions.insert_one(session)
+    session.pop("_id", None)
+    return session
+
+
+async def get_session(db, session_id: str, user_id: str) -> Dict[str, Any]:
+    session = await db.upload_sessions.find_one({"id": session_id, "user_id": user_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    return session
+
+
+async def append_chunk(db, session: Dict[str, Any], offset: int, body: AsyncIterator[bytes]) -> int:
+    """
+    Store one chunk of a session at `offset`; returns the new received byte count.
+
+    The offset must match what the server has already received, so a client
+    that lost a response can ask for the session and resume from there.
+    """
+    if offset != session["received"]:
+        raise HTTPException(status_code=409, detail={"message": "Offset mismatch", "received": session["received"]})
+
+    data = bytearray()
+    async for piece in body:
+        data.extend(piece)
+        if len(data) > MAX_SESSION_CHUNK_BYTES:
+            raise HTTPException(status_code=413, detail=f"Chunks are limited to {MAX_SESSION_CHUNK_BYTES} bytes")
+        if session["received"] + len(data) > session["size"]:
+            raise HTTPException(status_code=413, detail="Chunk runs past the declared size")
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty chunk")
+    if offset == 0 and sniff_image_type(bytes(data[:16])) is None:
+        raise HTTPException(status_code=415, detail="File is not a supported image")
+
+    # Writing the chunk keyed by offset is idempotent, so a retried chunk simply
+    # overwrites itself; the guarded $inc then admits it exactly once
+    await db.upload_session_chunks.update_one(
+        {"session_id": session["id"], "offset": offset},
+        {"$set": {"data": bytes(data), "expires_at": session["expires_at"]}},
+        upsert=True
+    )
+    result = await db.upload_sessions.update_one(
+        {"id": session["id"], "received": offset},
+        {"$inc": {"received": len(data), "chunks": 1}}
+    )
+    if result.modified_count == 0:
+        current = await db.upload_sessions.find_one({"id": session["id"]}, {"received": 1})
+        raise HTTPException(status_code=409, detail={"message": "Offset mismatch", "received": (current or {}).get("received", 0)})
+
+    return offset + len(data)
+
+
+async def session_chunks(db, session_id: str) -> AsyncIterator[bytes]:
+    cursor = db.upload_session_chunks.find({"session_id": session_id}, {"data": 1}).sort("offset", 1).batch_size(4)
+    async for doc in cursor:
+        yield doc["data"]
+
+
+async def complete_session(db, session: Dict[str, Any], metadata: Dict[str, Any]) -> Dict[str, Any]:
+    if session["received"] != session["size"]:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Upload incomplete", "received": session["received"], "size": session["size"]}
+        )
+    stored = await store_stream(db, session_chunks(db, session["id"]), session["filename"], metadata)
+    await discard_session(db, session["id"])
+    return await register_stored(db, stored)
+
+
+async def discard_session(db, session_id: str):
+    await db.upload_session_chunks.delete_many({"session_id": session_id})
+    await db.upload_sessions.delete_one({"id": session_id})
+
+
+async def discard_user_sessions(db, user_ids: List[str]):
+    sessions = await db.upload_sessions.find({"user_id": {"$in": user_ids}}, {"id": 1}).to_list(None)
+    session_ids = [s["id"] for s in sessions]
+    if session_ids:
+        await db.upload_session_chunks.delete_many({"session_id": {"$in": session_ids}})
+        await db.upload_sessions.delete_many({"id": {"$in": session_ids}})
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware rejecting oversized upload bodies before they are buffered.
+
+    `limits` maps a path to its maximum body size. Requests declaring a larger
+    Content-Length get a 413 without their body being read; chunked bodies
+    are cut off as soon as they cross the limit.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = ('{"detail":"Request body exceeds %d bytes"}' % limit).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+async def ensure_indexes(db):
+    await db.upload_sessions.create_index("id", unique=True)
+    await db.upload_sessions.create_index("expires_at", expireAfterSeconds=0)
+    await db.upload_session_chunks.create_index([("session_id", 1), ("offset", 1)], unique=True)
+    await db.upload_session_chunks.create_index("expires_at", expireAfterSeconds=0)
+    # Declared-hash dedup of upload sessions looks for the photo within the caller's college
+    await db.users.create_index([("college_id", 1), ("photos.sha256", 1)])
@@ -8,6 +8,9 @@ import { Upload, X, Image as ImageIcon } from "lucide-react";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Photos stored by the backend have paths relative to it
+const photoSrc = (url) => (url.startsWith("/") ? `${BACKEND_URL}${url}` : url);
+
 export default function PhotoSection({ profileData, onUpdate }) {
   const [uploading, setUploading] = useState(false);
   const [selectedSlot, setSelectedSlot] = useState(null);
@@ -94,7 +97,7 @@ export default function PhotoSection({ profileData, onUpdate }) {
               {photo ? (
                 <>
                   <img
-                    src={photo.file_url}
+                    src={photoSrc(photo.file_url)}
                     alt={`Slot ${index + 1}`}
                     className="w-full h-full object-cover"
                   />
@@ -33,7 +33,8 @@ export default function TestimonialSection() {
   const fetchData = async () => {
     try {
       const [studentsRes, receivedRes, writtenRes] = await Promise.all([
-        axios.get(`${API}/college/students`, {
+        // The cached, precompressed roster; the browser revalidates it with its ETag
+        axios.get(`${API}/college/directory`, {
           headers: { Authorization: `Bearer ${token}` },
         }),
         axios.get(`${API}/testimonials/received`, {
@@ -44,13 +45,17 @@ export default function TestimonialSection() {
         }),
       ]);
 
-      setCollegeStudents(studentsRes.data || []);
+      // The roster includes the current student
+      const currentUserId = JSON.parse(localStorage.getItem("userData") || "{}").id;
+      const students = (studentsRes.data || []).filter((s) => s.id !== currentUserId);
+
+      setCollegeStudents(students);
       setReceivedTestimonials(receivedRes.data || []);
       setWrittenTestimonials(writtenRes.data || []);
 
       // If there's a written testimonial for the first student, pre-select it
-      if (studentsRes.data && studentsRes.data.length > 0) {
-        const firstStudent = studentsRes.data[0];
+      if (students.length > 0) {
+        const firstStudent = students[0];
         const existingTestimonial = (writtenRes.data || []).find(
           (t) => t.to_student_id === firstStudent.id
         );
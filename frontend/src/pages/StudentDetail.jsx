@@ -22,6 +22,9 @@ import { ArrowLeft, Edit2, Save, X, Heart, Trash2 } from "lucide-react";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Photos stored by the backend have paths relative to it
+const photoSrc = (url) => (url.startsWith("/") ? `${BACKEND_URL}${url}` : url);
+
 export default function StudentDetail() {
   const { studentId } = useParams();
   const navigate = useNavigate();
@@ -344,8 +347,8 @@ export default function StudentDetail() {
               <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
                 {student.photos.map((photo, idx) => (
                   <div key={idx} className="text-center">
-                    {photo.file_url.startsWith("data:") ? (
-                      <img src={photo.file_url} alt={`Slot ${photo.slot_index}`} className="w-full h-40 object-cover rounded" />
+                    {photo.file_url.startsWith("data:") || photo.storage === "gridfs" ? (
+                      <img src={photoSrc(photo.file_url)} alt={`Slot ${photo.slot_index}`} className="w-full h-40 object-cover rounded" />
                     ) : (
                       <a href={photo.file_url} target="_blank" rel="noopener noreferrer" className="text-blue-600 underline">
                         View Photo {photo.slot_index}
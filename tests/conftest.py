@@ -0,0 +1,61 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend is a flat set of modules, imported the way server.py imports them
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+# server.py reads these at import; the app fixture swaps its database for an in-memory one
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "yearbook_test")
+
+
+@pytest.fixture
+def db():
+    """A fresh in-memory database with GridFS support"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    with mongomock_motor.enabled_gridfs_integration():
+        yield mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+@pytest.fixture
+def server(db, monkeypatch):
+    """server.py serving from the in-memory database"""
+    server = pytest.importorskip("server")
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "analytics_db", db)
+    server.tenants._limits_cache.clear()
+    server.directory._cache.clear()
+    return server
+
+
+@pytest.fixture
+def api(server):
+    """Returns a new async client for the app, to open inside the test's event loop"""
+    httpx = pytest.importorskip("httpx")
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+@pytest.fixture
+def auth(server):
+    """Authorization headers for a user id"""
+    return lambda user_id: {"Authorization": f"Bearer {server.create_access_token({'sub': user_id})}"}
+
+
+@pytest.fixture
+def seed(db):
+    """Returns a coroutine seeding a college with two questions and two photo slots, its students and an admin"""
+    async def seed_college(college_id="c1", students=3, prefix="s", **college):
+        await db.colleges.insert_one({"id": college_id, "name": college_id.upper(), "yearbook_questions": ["a", "b"],
+                                      "photo_slots": 2, "created_at": "2024-01-01", **college})
+        if not await db.users.find_one({"id": "admin"}):
+            await db.users.insert_one({"id": "admin", "email": "admin@test", "hashed_password": "-",
+                                       "user_type": "admin", "college_id": None, "profile": {}, "created_at": "2024-01-01"})
+        if students:
+            await db.users.insert_many([{
+                "id": f"{prefix}{i}", "email": f"{prefix}{i}@{college_id}.test", "hashed_password": "-",
+                "user_type": "student", "college_id": college_id, "profile": {"full_name": f"{prefix.upper()}{i}"},
+                "yearbook_answers": {}, "photos": [], "profile_completion": 25, "created_at": "2024-01-01"
+            } for i in range(students)])
+    return seed_college
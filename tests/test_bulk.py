@@ -0,0 +1,138 @@
+import asyncio
+
+import directory
+
+JPEG = b"\xff\xd8\xff\xe0" + b"a" * 3000
+OTHER_JPEG = b"\xff\xd8\xff\xe0" + b"b" * 3000
+
+
+async def _upload(c, auth, user_id, slot_index, data=JPEG):
+    r = await c.post(f"/api/photos/upload?slot_index={slot_index}", files={"file": ("a.jpg", data, "image/jpeg")},
+                     headers=auth(user_id))
+    assert r.status_code == 200
+    return r.json()
+
+
+async def _testimonial(db, author, target, college_id="c1"):
+    await db.testimonials.insert_one({"college_id": college_id, "from_student_id": author, "to_student_id": target,
+                                      "text": "hi", "created_at": "2024-01-01"})
+
+
+async def _refs(db):
+    return sorted(b["refs"] for b in await db.photo_blobs.find().to_list(None))
+
+
+def test_bulk_delete_cascades(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        await seed("c2", students=1, prefix="t")
+        await directory.get_snapshot(db, "c1")
+        async with api() as c:
+            await _upload(c, auth, "s0", 0)
+            await _upload(c, auth, "s1", 0, OTHER_JPEG)
+            await _upload(c, auth, "s2", 0)  # shares s0's file
+            session = {"slot_index": 1, "filename": "b.jpg", "content_type": "image/jpeg", "size": 100}
+            assert (await c.post("/api/photos/upload-sessions", json=session, headers=auth("s1"))).status_code == 200
+            await db.drive_credentials.insert_one({"user_id": "s0", "token": "-"})
+            await db.drive_credentials.insert_one({"user_id": "s2", "token": "-"})
+            for author, target in [("s0", "s2"), ("s2", "s1"), ("s2", "s2")]:
+                await _testimonial(db, author, target)
+
+            r = await c.post("/api/students/bulk-delete", json={"ids": ["s0", "s1", "t0", "nobody", "admin"]},
+                             headers=auth("admin"))
+            body = r.json()
+            assert r.status_code == 200
+            assert body["deleted"] == {"users": 3, "testimonials": 2, "drive_credentials": 1}
+            assert {x["id"]: x["status"] for x in body["results"]} == {
+                "s0": "deleted", "s1": "deleted", "t0": "deleted", "nobody": "not_found", "admin": "not_found"}
+
+            assert sorted(u["id"] for u in await db.users.find().to_list(None)) == ["admin", "s2"]
+            assert [(t["from_student_id"], t["to_student_id"]) for t in await db.testimonials.find().to_list(None)] == [("s2", "s2")]
+            assert [d["user_id"] for d in await db.drive_credentials.find().to_list(None)] == ["s2"]
+            assert await db.upload_sessions.count_documents({}) == 0
+            # s1's photo is gone; the file s0 shared with s2 is kept for s2
+            assert await _refs(db) == [1]
+            assert await db["photos.files"].count_documents({}) == 1
+            assert [e["id"] for e in (await directory.get_snapshot(db, "c1")).entries] == ["s2"]
+
+            assert (await c.post("/api/students/bulk-delete", json={"ids": ["s2"]}, headers=auth("s2"))).status_code == 403
+
+    asyncio.run(run())
+
+
+def test_bulk_delete_by_college_leaves_other_colleges(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        await seed("c2", students=2, prefix="t")
+        await _testimonial(db, "t0", "t1", "c2")
+        async with api() as c:
+            r = await c.post("/api/students/bulk-delete", json={"college_id": "c1"}, headers=auth("admin"))
+        assert r.json()["deleted"]["users"] == 3
+        assert sorted(u["id"] for u in await db.users.find({"user_type": "student"}).to_list(None)) == ["t0", "t1"]
+        assert await db.testimonials.count_documents({}) == 1
+
+    asyncio.run(run())
+
+
+def test_bulk_reset_clears_photos_answers_and_testimonials(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        await db.users.update_many({}, {"$set": {"yearbook_answers": {"0": "x", "1": "y"}}})
+        async with api() as c:
+            await _upload(c, auth, "s0", 0)
+            await _upload(c, auth, "s0", 1, OTHER_JPEG)
+            await _upload(c, auth, "s1", 0)
+            await _testimonial(db, "s0", "s1")
+            await _testimonial(db, "s2", "s1")
+
+            r = await c.post("/api/students/bulk-reset", headers=auth("admin"), json={
+                "ids": ["s0", "s2"], "photos": True, "yearbook_answers": True, "testimonials": True})
+        body = r.json()
+        assert body["success"] and body["matched_count"] == 2 and body["testimonials_deleted"] == 2
+
+        s0 = await db.users.find_one({"id": "s0"})
+        assert s0["photos"] == [] and s0["yearbook_answers"] == {} and s0["photos_rev"] == 3
+        assert s0["profile_completion"] == 25
+        # Only s1's photo is still referenced
+        assert await _refs(db) == [1]
+        assert len((await db.users.find_one({"id": "s1"}))["photos"]) == 1
+        assert await db.testimonials.count_documents({}) == 0
+
+    asyncio.run(run())
+
+
+def test_bulk_reset_retries_when_an_upload_lands_after_the_read(server, db, api, auth, seed, monkeypatch):
+    async def run():
+        await seed()
+        async with api() as c:
+            await _upload(c, auth, "s0", 0)
+            select_students = server.select_students
+
+            async def racing(selection, projection):
+                async for students, missing in select_students(selection, projection):
+                    await _upload(c, auth, "s0", 1, OTHER_JPEG)
+                    yield students, missing
+
+            monkeypatch.setattr(server, "select_students", racing)
+            r = await c.post("/api/students/bulk-reset", json={"ids": ["s0"], "photos": True}, headers=auth("admin"))
+        assert r.json()["results"] == [{"id": "s0", "status": "updated"}]
+        assert (await db.users.find_one({"id": "s0"}))["photos"] == []
+        # Both the photo read with the batch and the one uploaded meanwhile are released
+        assert await db.photo_blobs.count_documents({}) == 0
+        assert await db["photos.files"].count_documents({}) == 0
+
+    asyncio.run(run())
+
+
+def test_bulk_update_rewrites_profiles(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            r = await c.post("/api/students/bulk-update", headers=auth("admin"), json={
+                "college_id": "c1", "profile": {"nickname": "N", "phone": "1", "date_of_birth": "2000-01-01"}})
+        assert r.json()["matched_count"] == 3
+        student = await db.users.find_one({"id": "s1"})
+        assert student["profile"] == {"full_name": "S1", "nickname": "N", "phone": "1", "date_of_birth": "2000-01-01"}
+        assert student["profile_completion"] == 50
+
+    asyncio.run(run())
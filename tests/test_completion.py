@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from completion import JobBusy, calculate_profile_completion, job_id, repair_completion
+
+COLLEGE = {"yearbook_questions": ["a", "b"], "photo_slots": 2}
+FULL_PROFILE = {"full_name": "A", "nickname": "B", "phone": "1", "date_of_birth": "2000-01-01"}
+
+
+def test_basic_info_only():
+    assert calculate_profile_completion({"profile": {"full_name": "A"}, "yearbook_answers": {"0": "x"}}, COLLEGE) == 25
+
+
+def test_each_section_adds_a_quarter():
+    student = {"profile": FULL_PROFILE, "yearbook_answers": {"0": "x", "1": "y"}, "photos": [{}]}
+    assert calculate_profile_completion(student, COLLEGE) == 75
+    student["photos"].append({})
+    assert calculate_profile_completion(student, COLLEGE) == 100
+
+
+def test_college_without_questions_counts_answers_complete():
+    assert calculate_profile_completion({}, {"yearbook_questions": [], "photo_slots": 1}) == 50
+
+
+def test_photo_slots_default_to_four():
+    student = {"photos": [{}] * 3}
+    assert calculate_profile_completion(student, {"yearbook_questions": ["a"]}) == 25
+    student["photos"] = [{}] * 4
+    assert calculate_profile_completion(student, {"yearbook_questions": ["a"]}) == 50
+
+
+def _students(n, college_id="c1", completion=0):
+    return [{"id": f"s{i:02d}", "college_id": college_id, "user_type": "student", "profile": {"full_name": f"S{i}"},
+             "yearbook_answers": {}, "photos": [], "profile_completion": completion} for i in range(n)]
+
+
+async def _seed(db, n=5, completion=0):
+    await db.colleges.insert_one({"id": "c1", **COLLEGE})
+    await db.users.insert_many(_students(n, completion=completion))
+
+
+def test_repair_corrects_only_stale_values(db):
+    async def run():
+        await _seed(db, 4)
+        await db.users.update_one({"id": "s01"}, {"$set": {"profile_completion": 25}})
+        job = await repair_completion(db, "c1", batch_size=3, rate=0)
+        assert (job["status"], job["scanned"], job["corrected"], job["last_id"]) == ("finished", 4, 3, "s03")
+        assert {u["profile_completion"] for u in await db.users.find().to_list(None)} == {25}
+
+    asyncio.run(run())
+
+
+def test_repair_resumes_from_its_checkpoint(db):
+    async def run():
+        await _seed(db, 5)
+        await db.maintenance_jobs.insert_one({"_id": job_id("c1"), "status": "failed", "college_id": "c1",
+                                              "last_id": "s02", "scanned": 3, "corrected": 3, "lease_until": None})
+        job = await repair_completion(db, "c1", rate=0)
+        assert (job["scanned"], job["corrected"]) == (5, 5)
+        fixed = {u["id"] for u in await db.users.find({"profile_completion": 25}).to_list(None)}
+        assert fixed == {"s03", "s04"}
+
+        # A finished job, or restart=True, starts over from the first student
+        job = await repair_completion(db, "c1", rate=0)
+        assert (job["scanned"], job["corrected"]) == (5, 3)
+
+    asyncio.run(run())
+
+
+def test_live_lease_makes_the_job_busy(db):
+    async def run():
+        await _seed(db, 2)
+        now = datetime.now(timezone.utc)
+        await db.maintenance_jobs.insert_one({"_id": job_id("c1"), "status": "running", "last_id": None,
+                                              "lease_until": (now + timedelta(minutes=5)).isoformat()})
+        with pytest.raises(JobBusy):
+            await repair_completion(db, "c1", rate=0)
+
+        # An expired lease belongs to a worker that died; the job can be taken over
+        await db.maintenance_jobs.update_one({"_id": job_id("c1")}, {"$set": {
+            "lease_until": (now - timedelta(minutes=5)).isoformat(), "scanned": 0, "corrected": 0}})
+        assert (await repair_completion(db, "c1", rate=0))["status"] == "finished"
+
+    asyncio.run(run())
+
+
+class _RacingUsers:
+    """The users collection, except that a live write to s00 lands just before each repair write"""
+
+    def __init__(self, users):
+        self._users = users
+
+    def __getattr__(self, name):
+        return getattr(self._users, name)
+
+    async def bulk_write(self, operations, **kwargs):
+        await self._users.update_one({"id": "s00"}, {"$set": {"profile_completion": 75}})
+        return await self._users.bulk_write(operations, **kwargs)
+
+
+class _RacingDb:
+    def __init__(self, db):
+        self._db = db
+        self.users = _RacingUsers(db.users)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def test_repair_does_not_overwrite_a_live_write(db):
+    async def run():
+        await _seed(db, 2)
+        job = await repair_completion(_RacingDb(db), "c1", rate=0)
+        assert job["corrected"] == 1
+        assert (await db.users.find_one({"id": "s00"}))["profile_completion"] == 75
+        assert (await db.users.find_one({"id": "s01"}))["profile_completion"] == 25
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import json
+
+from db_monitor import (MAX_TRACED_QUERIES, TRACE_HEADER, RequestTrace, _trace_requested, command_shape,
+                        query_shape, trace_header)
+
+
+def test_query_shape_strips_values():
+    shape = query_shape({"email": "a@b.c", "age": {"$gt": 20}, "id": {"$in": ["x", "y"]}})
+    assert shape == {"email": "?", "age": {"$gt": "?"}, "id": {"$in": ["?"]}}
+
+
+def test_query_shape_keeps_nested_operators():
+    shape = query_shape({"$or": [{"from_student_id": "s1"}, {"to_student_id": "s1"}]})
+    assert shape == {"$or": [{"from_student_id": "?"}, {"to_student_id": "?"}]}
+
+
+def test_command_shape_of_aggregate_only_shapes_matches():
+    command = {"pipeline": [{"$match": {"college_id": "c1"}}, {"$sort": {"name": 1}}, {"$limit": 5}]}
+    assert command_shape("aggregate", command) == [{"$match": {"college_id": "?"}}, ["$sort"], ["$limit"]]
+
+
+def test_command_shape_of_update_hides_values():
+    command = {"updates": [{"q": {"id": "secret-id"}, "u": {"$set": {"password": "hunter2"}}}]}
+    assert command_shape("update", command) == [{"id": "?"}]
+
+
+def test_tracing_is_off_without_a_token(monkeypatch):
+    monkeypatch.delenv("QUERY_TRACE_TOKEN", raising=False)
+    assert not _trace_requested({TRACE_HEADER.encode(): b"1"})
+
+
+def test_tracing_requires_the_token(monkeypatch):
+    monkeypatch.setenv("QUERY_TRACE_TOKEN", "s3cret")
+    assert not _trace_requested({TRACE_HEADER.encode(): b"guess"})
+    assert _trace_requested({TRACE_HEADER.encode(): b"s3cret"})
+
+
+def test_trace_header_is_capped_in_bytes():
+    trace = RequestTrace("r1")
+    for i in range(MAX_TRACED_QUERIES):
+        trace.record({"command": "find", "collection": "users", "filter": {f"field_{i}": "?" * 50}, "duration_ms": 1.0})
+    value = trace_header(trace, max_bytes=2048)
+    payload = json.loads(value)
+    assert len(value) <= 2048
+    assert payload["truncated"] and 0 < len(payload["queries"]) < MAX_TRACED_QUERIES
+    assert payload["queries"] == trace.queries[:len(payload["queries"])]
+
+
+def test_small_trace_header_is_complete():
+    trace = RequestTrace("r1")
+    trace.record({"command": "find", "collection": "users", "filter": {"id": "?"}, "duration_ms": 1.0})
+    assert json.loads(trace_header(trace)) == {"request_id": "r1", "queries": trace.queries, "truncated": False}
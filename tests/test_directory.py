@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+import directory
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    directory._cache.clear()
+
+
+def _student(i, college_id="c1", **fields):
+    return {"id": f"s{i}", "college_id": college_id, "user_type": "student", "profile": {"full_name": f"S{i}"}, **fields}
+
+
+async def _seed(db, n=5):
+    await db.users.insert_many([_student(i) for i in range(n)])
+
+
+def _ids(snapshot):
+    return sorted(e["id"] for e in snapshot.entries)
+
+
+def test_first_read_builds_from_users(db):
+    async def run():
+        await _seed(db)
+        snapshot = await directory.get_snapshot(db, "c1")
+        assert _ids(snapshot) == ["s0", "s1", "s2", "s3", "s4"]
+
+    asyncio.run(run())
+
+
+def test_write_before_first_read_does_not_replace_the_build(db):
+    async def run():
+        await _seed(db)
+        await directory.upsert_students(db, [_student(0, profile={"full_name": "S0", "nickname": "N"})])
+        assert await db.directory_versions.count_documents({}) == 0
+
+        snapshot = await directory.get_snapshot(db, "c1")
+        assert _ids(snapshot) == ["s0", "s1", "s2", "s3", "s4"]
+
+    asyncio.run(run())
+
+
+def test_concurrent_first_reads(db):
+    async def run():
+        await _seed(db)
+        snapshots = await asyncio.gather(*(directory.get_snapshot(db, "c1") for _ in range(4)))
+        assert all(len(s.entries) == 5 for s in snapshots)
+        assert await db.college_directory.count_documents({}) == 5
+
+    asyncio.run(run())
+
+
+def test_writes_after_build_bump_the_version(db):
+    async def run():
+        await _seed(db, 2)
+        first = await directory.get_snapshot(db, "c1")
+
+        await directory.upsert_students(db, [_student(1, profile={"full_name": "S1", "nickname": "Nick"})])
+        second = await directory.get_snapshot(db, "c1")
+        assert second.version > first.version and second.etag != first.etag
+        assert next(e for e in second.entries if e["id"] == "s1")["nickname"] == "Nick"
+
+        await directory.remove_students(db, [_student(0)])
+        assert _ids(await directory.get_snapshot(db, "c1")) == ["s1"]
+
+    asyncio.run(run())
+
+
+def test_unchanged_version_serves_the_cached_snapshot(db):
+    async def run():
+        await _seed(db, 2)
+        assert await directory.get_snapshot(db, "c1") is await directory.get_snapshot(db, "c1")
+
+    asyncio.run(run())
+
+
+def test_entry_uses_first_stored_photo_as_thumbnail():
+    student = _student(0, photos=[
+        {"slot_index": 1, "storage": "gridfs", "file_url": "/api/photos/files/b"},
+        {"slot_index": 0, "file_url": "data:image/png;base64,xx"},
+        {"slot_index": 2, "storage": "gridfs", "file_url": "/api/photos/files/c"},
+    ])
+    entry = directory.directory_entry(student)
+    assert entry["thumbnail"] == "/api/photos/files/b"
+    assert entry["photo_count"] == 3 and entry["name"] == "S0"
+
+
+def test_directory_endpoint_serves_the_cached_bytes(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            r = await c.get("/api/college/directory", headers={**auth("s0"), "Accept-Encoding": "gzip"})
+            assert r.status_code == 200 and r.headers["content-encoding"] == "gzip"
+            assert sorted(e["id"] for e in json.loads(r.content)) == ["s0", "s1", "s2"]
+
+            r = await c.get("/api/college/directory", headers={**auth("s0"), "If-None-Match": r.headers["etag"]})
+            assert r.status_code == 304
+
+            await seed("c2", students=1, prefix="t")
+            r = await c.get("/api/college/directory?college_id=c1", headers=auth("t0"))
+            assert r.status_code == 403
+
+    asyncio.run(run())
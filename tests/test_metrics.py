@@ -0,0 +1,73 @@
+import math
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+from metrics import MetricsMiddleware, MetricsRegistry, _quantile
+
+
+def _value(text, line_prefix):
+    return next(line.rsplit(" ", 1)[1] for line in text.splitlines() if line.startswith(line_prefix))
+
+
+def test_quantiles():
+    values = [float(v) for v in range(1, 101)]
+    assert _quantile(values, 0.5) == 50
+    assert _quantile(values, 0.99) == 99
+    assert _quantile([7.0], 0.95) == 7
+    assert math.isnan(_quantile([], 0.5))
+
+
+def test_render_counts_statuses_and_buckets():
+    registry = MetricsRegistry()
+    registry.observe("GET", "/api/students", 0.02, 100, 200, 3)
+    registry.observe("GET", "/api/students", 0.3, 300, 200, 5)
+    registry.observe("GET", "/api/students", 0.004, 10, 404, 1)
+    text = registry.render()
+
+    labels = 'method="GET",route="/api/students"'
+    assert _value(text, f'http_requests_total{{{labels},status="200"}}') == "2"
+    assert _value(text, f'http_requests_total{{{labels},status="404"}}') == "1"
+    # Histogram buckets are cumulative
+    assert _value(text, f'http_request_duration_seconds_bucket{{{labels},le="0.005"}}') == "1"
+    assert _value(text, f'http_request_duration_seconds_bucket{{{labels},le="0.025"}}') == "2"
+    assert _value(text, f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}') == "3"
+    assert _value(text, f'http_response_size_bytes{{{labels},quantile="0.5"}}') == "100"
+    assert _value(text, f"http_request_db_commands_sum{{{labels}}}") == "9"
+    assert text.endswith("\n")
+
+
+def test_labels_are_escaped():
+    registry = MetricsRegistry()
+    registry.observe("GET", '/a"b\\c', 0.01, 1, 200, 0)
+    assert 'route="/a\\"b\\\\c"' in registry.render()
+
+
+def test_tenants_past_the_cap_are_reported_as_other(monkeypatch):
+    monkeypatch.setattr(metrics, "MAX_TENANTS", 2)
+    registry = MetricsRegistry()
+    for tenant in ("c1", "c2", "c3", "c4", "c1"):
+        registry.observe("GET", "/x", 0.01, 1, 200, 0, tenant)
+    text = registry.render()
+    assert _value(text, 'http_tenant_requests_total{college="c1",status="200"}') == "2"
+    assert _value(text, 'http_tenant_requests_total{college="other",status="200"}') == "2"
+    assert 'college="c3"' not in text
+
+
+def test_middleware_labels_by_route_template():
+    registry = MetricsRegistry()
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    app.add_middleware(MetricsMiddleware, registry=registry)
+    client = TestClient(app)
+    client.get("/items/a")
+    client.get("/items/b")
+    client.get("/missing")
+    text = registry.render()
+    assert _value(text, 'http_requests_total{method="GET",route="/items/{item_id}",status="200"}') == "2"
+    assert _value(text, 'http_requests_total{method="GET",route="unmatched",status="404"}') == "1"
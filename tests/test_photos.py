@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+
+JPEG = b"\xff\xd8\xff\xe0" + b"a" * 3000
+OTHER_JPEG = b"\xff\xd8\xff\xe0" + b"b" * 3000
+
+
+class _UploadFile:
+    """Enough of Starlette's UploadFile for store_photo"""
+
+    def __init__(self, data: bytes, filename: str = "a.jpg"):
+        self.file = io.BytesIO(data)
+        self.filename = filename
+        self.content_type = "image/jpeg"
+        self.size = len(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    async def seek(self, offset: int):
+        self.file.seek(offset)
+
+
+def _jpeg(data=JPEG, name="a.jpg"):
+    return {"file": (name, data, "image/jpeg")}
+
+
+async def _upload(c, auth, user_id, slot_index, data=JPEG):
+    return await c.post(f"/api/photos/upload?slot_index={slot_index}", files=_jpeg(data), headers=auth(user_id))
+
+
+async def _refs(db):
+    return {b["_id"]: b["refs"] for b in await db.photo_blobs.find().to_list(None)}
+
+
+def test_upload_stores_and_replaces(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            r = await _upload(c, auth, "s0", 0)
+            assert r.status_code == 200 and r.json()["file_url"].startswith("/api/photos/files/")
+            assert (await c.get(r.json()["file_url"])).content == JPEG
+
+            await _upload(c, auth, "s0", 0, OTHER_JPEG)
+            assert list((await _refs(db)).values()) == [1]
+            assert await db["photos.files"].count_documents({}) == 1
+            assert (await c.get(r.json()["file_url"])).status_code == 404
+
+    asyncio.run(run())
+
+
+def test_identical_uploads_share_one_file(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            first = (await _upload(c, auth, "s0", 0)).json()
+            second = (await _upload(c, auth, "s1", 1)).json()
+        assert second["deduplicated"] and second["file_url"] == first["file_url"]
+        assert list((await _refs(db)).values()) == [2]
+
+    asyncio.run(run())
+
+
+def test_concurrent_uploads_to_different_slots_are_kept(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            responses = await asyncio.gather(_upload(c, auth, "s0", 0), _upload(c, auth, "s0", 1, OTHER_JPEG))
+        assert [r.status_code for r in responses] == [200, 200]
+        student = await db.users.find_one({"id": "s0"})
+        assert sorted(p["slot_index"] for p in student["photos"]) == [0, 1]
+
+    asyncio.run(run())
+
+
+def test_upload_for_a_deleted_user_releases_its_reference(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            await _upload(c, auth, "s1", 0)
+            user = await db.users.find_one({"id": "s0"}, {"_id": 0})
+            await db.users.delete_one({"id": "s0"})
+
+            photo, _ = await server.store_photo(user, _UploadFile(JPEG), 0, None)
+            assert list((await _refs(db)).values()) == [2]
+            with pytest.raises(server.HTTPException) as e:
+                await server.set_photo_slots(user, [photo])
+            assert e.value.status_code == 404
+        assert list((await _refs(db)).values()) == [1]
+
+    asyncio.run(run())
+
+
+def test_declared_hash_only_matches_photos_of_the_callers_college(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        await seed("c2", prefix="t")
+        sha256 = hashlib.sha256(JPEG).hexdigest()
+        session = {"slot_index": 0, "filename": "a.jpg", "content_type": "image/jpeg", "size": len(JPEG), "sha256": sha256}
+        async with api() as c:
+            await _upload(c, auth, "s0", 0)
+
+            other_college = (await c.post("/api/photos/upload-sessions", json=session, headers=auth("t0"))).json()
+            assert "session_id" in other_college and "deduplicated" not in other_college
+
+            same_college = (await c.post("/api/photos/upload-sessions", json=session, headers=auth("s1"))).json()
+            assert same_college["deduplicated"]
+        assert list((await _refs(db)).values()) == [2]
+
+    asyncio.run(run())
+
+
+
+def _batch(*items):
+    files = [("files", (f"{slot}.jpg", data, "image/jpeg")) for slot, data in items]
+    return {"files": files, "data": {"slot_indexes": [str(slot) for slot, _ in items]}}
+
+
+def test_batch_keeps_the_photos_that_passed(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            r = await c.post("/api/photos/upload-batch", **_batch((0, JPEG), (1, b"not an image")), headers=auth("s0"))
+        body = r.json()
+        assert r.status_code == 200 and body["success"] is False
+        results = {result["slot_index"]: result for result in body["results"]}
+        assert results[0]["success"] and results[0]["file_url"].startswith("/api/photos/files/")
+        assert not results[1]["success"] and results[1]["status_code"] == 415
+
+        student = await db.users.find_one({"id": "s0"})
+        assert [p["slot_index"] for p in student["photos"]] == [0]
+        assert list((await _refs(db)).values()) == [1]
+
+    asyncio.run(run())
+
+
+def test_batch_stores_all_slots_in_one_write(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            r = await c.post("/api/photos/upload-batch", **_batch((0, JPEG), (1, OTHER_JPEG)), headers=auth("s0"))
+        assert r.json()["success"] and r.json()["profile_completion"] == 50
+        student = await db.users.find_one({"id": "s0"})
+        assert sorted(p["slot_index"] for p in student["photos"]) == [0, 1] and student["photos_rev"] == 1
+
+    asyncio.run(run())
+
+
+def test_batch_with_no_valid_photo_fails(server, db, api, auth, seed):
+    async def run():
+        await seed()
+        async with api() as c:
+            r = await c.post("/api/photos/upload-batch", **_batch((0, b"nope"), (1, b"nor this")), headers=auth("s0"))
+        assert r.status_code == 400 and len(r.json()["detail"]["results"]) == 2
+        assert await db.photo_blobs.count_documents({}) == 0
+        assert (await db.users.find_one({"id": "s0"}))["photos"] == []
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("slots", [[0, 0], [0]])
+def test_batch_rejects_bad_slot_lists(server, db, api, auth, seed, slots):
+    async def run():
+        await seed()
+        files = [("files", ("a.jpg", JPEG, "image/jpeg")), ("files", ("b.jpg", OTHER_JPEG, "image/jpeg"))]
+        async with api() as c:
+            r = await c.post("/api/photos/upload-batch", files=files, data={"slot_indexes": [str(s) for s in slots]},
+                             headers=auth("s0"))
+        assert r.status_code == 400
+        assert await db.photo_blobs.count_documents({}) == 0
+
+    asyncio.run(run())
@@ -0,0 +1,84 @@
+import cProfile
+import time
+
+from profiling import ProfileStore, collapsed_stacks
+
+
+def _leaf():
+    return sum(range(20000))
+
+
+def _branch():
+    return _leaf() + _leaf()
+
+
+def _profile() -> cProfile.Profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+    _branch()
+    profiler.disable()
+    return profiler
+
+
+class _Stats:
+    """A pstats.Stats stand-in: {func: (cc, nc, tt, ct, callers)}"""
+
+    def __init__(self, raw):
+        self.stats = raw
+
+
+def _dense_graph(layers: int, width: int) -> _Stats:
+    # Every function calls every function of the next layer: width ** layers paths
+    funcs = [[("m.py", layer * 100 + i, f"f{layer}_{i}") for i in range(width)] for layer in range(layers)]
+    raw = {}
+    for layer, row in enumerate(funcs):
+        for func in row:
+            callers = {caller: (1, 1, 0.001, 0.01) for caller in funcs[layer - 1]} if layer else {}
+            raw[func] = (width, width, 0.001, 0.01 * width, callers)
+    return _Stats(raw)
+
+
+def test_collapsed_stacks_follow_the_call_graph():
+    import pstats
+    lines = collapsed_stacks(pstats.Stats(_profile()))
+    stacks = [line.rsplit(" ", 1)[0] for line in lines]
+    edges = [stack.split(";")[-2:] for stack in stacks if ";" in stack]
+    assert any(caller.endswith(":_branch") and callee.endswith(":_leaf") for caller, callee in edges)
+    assert all(int(line.rsplit(" ", 1)[1]) >= 1 for line in lines)
+
+
+def test_collapsed_stacks_are_bounded_on_dense_graphs():
+    started = time.perf_counter()
+    lines = collapsed_stacks(_dense_graph(layers=12, width=10), max_nodes=5000)
+    assert time.perf_counter() - started < 5
+    assert 0 < len(lines) <= 5000
+
+
+def _meta(n):
+    return {"path": "/api/students", "method": "GET", "request_id": f"r{n}", "started_at": 1000 + n}
+
+
+def test_store_prunes_the_oldest(tmp_path):
+    store = ProfileStore(tmp_path, max_profiles=2)
+    ids = [store.save(_profile(), _meta(n)) for n in range(3)]
+    assert [p["id"] for p in store.list()] == [ids[2], ids[1]]
+    assert not list(tmp_path.glob(f"{ids[0]}.*"))
+
+
+def test_path_for_builds_collapsed_stacks_on_first_use(tmp_path):
+    store = ProfileStore(tmp_path, max_profiles=5)
+    profile_id = store.save(_profile(), _meta(1))
+    assert not (tmp_path / f"{profile_id}.collapsed").exists()
+
+    path = store.path_for(profile_id, "collapsed")
+    assert path == tmp_path / f"{profile_id}.collapsed"
+    assert "_leaf" in path.read_text()
+    assert store.path_for(profile_id, "pstats") == tmp_path / f"{profile_id}.prof"
+
+
+def test_path_for_rejects_unknown_ids_and_formats(tmp_path):
+    store = ProfileStore(tmp_path, max_profiles=5)
+    profile_id = store.save(_profile(), _meta(1))
+    assert store.path_for(profile_id, "svg") is None
+    assert store.path_for("../etc/passwd", "pstats") is None
+    assert store.path_for("missing", "collapsed") is None
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import tenants
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setenv("TENANT_DAILY_UPLOAD_BYTES", "1000")
+    monkeypatch.setenv("TENANT_DAILY_TESTIMONIALS", "0")
+    tenants._limits_cache.clear()
+
+
+def test_first_use_of_counter_is_limited(db):
+    async def run():
+        with pytest.raises(HTTPException) as e:
+            await tenants.consume(db, "c1", "upload_bytes", 50_000, "daily_upload_bytes")
+        assert e.value.status_code == 429
+        usage = await tenants.usage(db, "c1")
+        assert usage["today"]["upload_bytes"] == 0
+
+    asyncio.run(run())
+
+
+def test_consume_up_to_the_limit(db):
+    async def run():
+        await tenants.consume(db, "c1", "upload_bytes", 600, "daily_upload_bytes")
+        await tenants.consume(db, "c1", "upload_bytes", 400, "daily_upload_bytes")
+        with pytest.raises(HTTPException):
+            await tenants.consume(db, "c1", "upload_bytes", 1, "daily_upload_bytes")
+        # Other colleges have their own counters
+        await tenants.consume(db, "c2", "upload_bytes", 1000, "daily_upload_bytes")
+
+    asyncio.run(run())
+
+
+def test_zero_limit_counts_without_limiting(db):
+    async def run():
+        for _ in range(3):
+            await tenants.consume(db, "c1", "testimonials", 1, "daily_testimonials")
+        assert (await tenants.usage(db, "c1"))["today"]["testimonials"] == 3
+
+    asyncio.run(run())
+
+
+def test_college_overrides_defaults(db):
+    async def run():
+        await db.colleges.insert_one({"id": "c1", "limits": {"daily_upload_bytes": 10}})
+        with pytest.raises(HTTPException):
+            await tenants.consume(db, "c1", "upload_bytes", 11, "daily_upload_bytes")
+
+    asyncio.run(run())
+
+
+def test_student_quota(db):
+    async def run():
+        await db.colleges.insert_one({"id": "c1", "limits": {"max_students": 2}})
+        await db.users.insert_one({"id": "s0", "college_id": "c1", "user_type": "student"})
+        await tenants.check_student_quota(db, "c1", 1)
+        with pytest.raises(HTTPException):
+            await tenants.check_student_quota(db, "c1", 2)
+
+    asyncio.run(run())
+
+
+def test_bulk_upload_quota_counts_only_new_valid_rows(server, db, api, auth, seed):
+    async def run():
+        await seed(limits={"max_students": 4})
+        rows = [{"name": "New", "email": "new@c1.test"}, {"name": "", "email": "blank@c1.test"},
+                {"name": "Dup", "email": "s0@c1.test"}, {"name": "New again", "email": "new@c1.test"}]
+        async with api() as c:
+            r = await c.post("/api/students/bulk-upload", json={"college_id": "c1", "students": rows},
+                             headers=auth("admin"))
+            assert r.status_code == 200 and r.json()["created_count"] == 1
+
+            r = await c.post("/api/students/bulk-upload", headers=auth("admin"), json={
+                "college_id": "c1", "students": [{"name": "Over", "email": "over@c1.test"}]})
+            assert r.status_code == 429
+
+    asyncio.run(run())
@@ -0,0 +1,27 @@
+import asyncio
+
+from directory import directory_entry
+from testimonial_queries import STUDENT_CARD
+
+STUDENTS = [
+    {"id": "a", "name": "Account A", "profile": {"full_name": "Profile A"}},
+    {"id": "b", "name": "", "profile": {"full_name": "Profile B"}},
+    {"id": "c", "profile": {"full_name": "Profile C"}},
+    {"id": "d", "name": None, "profile": {}},
+    {"id": "e", "name": "Account E", "photos": [
+        {"slot_index": 0, "file_url": "data:image/png;base64,xx"},
+        {"slot_index": 1, "storage": "gridfs", "file_url": "/api/photos/files/e1"},
+    ]},
+]
+
+
+def test_student_card_matches_the_roster_entry(db):
+    async def run():
+        await db.users.insert_many([dict(s) for s in STUDENTS])
+        cards = await db.users.aggregate([{"$sort": {"id": 1}}, {"$project": STUDENT_CARD}]).to_list(None)
+        for student, card in zip(STUDENTS, cards):
+            entry = directory_entry(student)
+            assert card["name"] == entry["name"]
+            assert card.get("thumbnail") == entry["thumbnail"]
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import uploads
+
+JPEG = b"\xff\xd8\xff\xe0" + b"x" * 100
+
+
+def test_sniff_image_type():
+    assert uploads.sniff_image_type(JPEG) == "image/jpeg"
+    assert uploads.sniff_image_type(b"\x89PNG\r\n\x1a\n....") == "image/png"
+    assert uploads.sniff_image_type(b"GIF89a....") == "image/gif"
+    assert uploads.sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert uploads.sniff_image_type(b"RIFF\x00\x00\x00\x00WAVEfmt ") is None
+    assert uploads.sniff_image_type(b"<html>") is None
+
+
+def test_upload_check_hashes_and_counts():
+    check = uploads.UploadCheck()
+    check.feed(JPEG[:50])
+    check.feed(JPEG[50:])
+    assert check.content_type == "image/jpeg"
+    assert check.size == len(JPEG)
+    assert len(check.finish()) == 64
+
+
+def test_upload_check_rejects_non_images():
+    with pytest.raises(HTTPException) as e:
+        uploads.UploadCheck().feed(b"not an image")
+    assert e.value.status_code == 415
+
+
+def test_upload_check_rejects_oversized(monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_PHOTO_BYTES", 150)
+    check = uploads.UploadCheck()
+    check.feed(JPEG)
+    with pytest.raises(HTTPException) as e:
+        check.feed(b"x" * 100)
+    assert e.value.status_code == 413
+
+
+def test_upload_check_rejects_empty():
+    with pytest.raises(HTTPException) as e:
+        uploads.UploadCheck().finish()
+    assert e.value.status_code == 400
+
+
+async def _chunks(data):
+    yield data
+
+
+def _photo(stored):
+    return {"storage": "gridfs", "file_id": stored["file_id"], "sha256": stored["sha256"]}
+
+
+def test_refcounts_share_and_release(db):
+    async def run():
+        stored = await uploads.register_stored(db, await uploads.store_stream(db, _chunks(JPEG), "a.jpg", {}))
+        assert stored["deduplicated"] is False
+
+        again = await uploads.acquire_existing(db, stored["sha256"])
+        assert again["file_id"] == stored["file_id"] and again["deduplicated"]
+        assert (await db.photo_blobs.find_one({"_id": stored["sha256"]}))["refs"] == 2
+
+        await uploads.release_photos(db, [_photo(stored)])
+        assert (await db.photo_blobs.find_one({"_id": stored["sha256"]}))["refs"] == 1
+        assert await uploads.open_photo(db, stored["file_id"]) is not None
+
+        await uploads.release_photos(db, [_photo(stored)])
+        assert await db.photo_blobs.find_one({"_id": stored["sha256"]}) is None
+        assert await uploads.open_photo(db, stored["file_id"]) is None
+
+    asyncio.run(run())
+
+
+def test_concurrent_copy_goes_to_existing_blob(db):
+    async def run():
+        first = await uploads.register_stored(db, await uploads.store_stream(db, _chunks(JPEG), "a.jpg", {}))
+        copy = await uploads.store_stream(db, _chunks(JPEG), "b.jpg", {})
+        second = await uploads.register_stored(db, copy)
+
+        assert second["file_id"] == first["file_id"] and second["deduplicated"]
+        assert await uploads.open_photo(db, copy["file_id"]) is None
+        assert (await db.photo_blobs.find_one({"_id": first["sha256"]}))["refs"] == 2
+
+    asyncio.run(run())
+
+
+def test_release_groups_slots_of_one_blob(db):
+    async def run():
+        stored = await uploads.register_stored(db, await uploads.store_stream(db, _chunks(JPEG), "a.jpg", {}))
+        await uploads.acquire_existing(db, stored["sha256"])
+        await uploads.release_photos(db, [_photo(stored), _photo(stored), {"storage": "drive", "file_id": "d"}])
+        assert await db.photo_blobs.count_documents({}) == 0
+
+    asyncio.run(run())
+
+
+def test_file_ids_are_random_tokens(db):
+    async def run():
+        a = await uploads.store_stream(db, _chunks(JPEG), "a.jpg", {})
+        b = await uploads.store_stream(db, _chunks(JPEG), "b.jpg", {})
+        assert isinstance(a["file_id"], str) and len(a["file_id"]) >= 32
+        assert a["file_id"] != b["file_id"]
+
+    asyncio.run(run())